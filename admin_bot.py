@@ -1,6 +1,13 @@
+import io
 import os
+import csv
+import json
+import time
 import asyncio
 import html
+import logging
+from collections import OrderedDict
+from datetime import timedelta
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
@@ -8,7 +15,12 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from telethon import TelegramClient
 from telethon.sessions import StringSession
-from database import db
+import asyncpg
+from database import admin_db as db
+from supervisor import supervisor
+import metrics
+import tracing
+import logs
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,6 +29,10 @@ API_ID = int(os.getenv("API_ID"))
 API_HASH = os.getenv("API_HASH")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = int(os.getenv("CHAT_ID"))
+ADMIN_VIEW_TTL = float(os.getenv("ADMIN_VIEW_TTL", "30")) # Seconds a rendered screen is reused
+REGISTRATION_TTL = float(os.getenv("REGISTRATION_TTL", "600")) # Seconds a pending login may sit idle
+
+log = logging.getLogger("admin_bot")
 
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
@@ -34,9 +50,26 @@ class CommentAddition(StatesGroup):
     waiting_for_ch_id = State()
     waiting_for_text = State()
 
+class CommentImport(StatesGroup):
+    waiting_for_file = State()
+
 class JoinAll(StatesGroup):
     waiting_for_link = State()
 
+PAGE_SIZE = 10 # Rows per admin list page
+MAX_IMPORT_BYTES = 2 * 1024 * 1024
+MAX_COMMENT_LENGTH = 4096 # Telegram's message limit
+MAX_COMMENT_WEIGHT = 1000
+HISTORY_PERIODS = {1: "1 soat", 24: "24 soat", 168: "7 kun"} # Send history summary windows, hours
+
+@dp.update.outer_middleware()
+async def measure_update(handler, event, data):
+    start = time.perf_counter()
+    try:
+        return await handler(event, data)
+    finally:
+        metrics.admin_update_seconds.observe(time.perf_counter() - start)
+
 # --- Keyboards ---
 def get_main_menu():
     builder = InlineKeyboardBuilder()
@@ -44,6 +77,8 @@ def get_main_menu():
     builder.row(types.InlineKeyboardButton(text="📢 Kanallar", callback_data="manage_channels"))
     builder.row(types.InlineKeyboardButton(text="➕ Akkaunt Qo'shish", callback_data="add_account"))
     builder.row(types.InlineKeyboardButton(text="🔗 Ommaviy Qo'shilish", callback_data="join_all_start"))
+    builder.row(types.InlineKeyboardButton(text="⏱ Kechikishlar", callback_data="latency_stats"))
+    builder.row(types.InlineKeyboardButton(text="📊 Statistika", callback_data="history_24"))
     return builder.as_markup()
 
 def get_cancel_kb():
@@ -60,41 +95,256 @@ async def start_handler(message: types.Message):
 
 @dp.callback_query(F.data == "cancel_action")
 async def cancel_handler(callback: types.CallbackQuery, state: FSMContext):
+    await login_sessions.close(callback.from_user.id)
     await state.clear()
     await callback.message.edit_text("❌ Amal bekor qilindi.", reply_markup=get_main_menu())
 
 @dp.callback_query(F.data == "main_menu")
 async def back_to_main_menu(callback: types.CallbackQuery, state: FSMContext):
+    await login_sessions.close(callback.from_user.id)
     await state.clear()
     await callback.message.edit_text("👋 Salom Admin! Quyidagi menyudan foydalaning:", reply_markup=get_main_menu())
 
+# --- Latency Stats ---
+@dp.callback_query(F.data == "latency_stats")
+async def latency_stats(callback: types.CallbackQuery):
+    # Traces live in the userbot's memory, so this only has data when both run under run_all.py
+    summary = tracing.recorder.summary()
+    builder = InlineKeyboardBuilder()
+    builder.row(types.InlineKeyboardButton(text="🔄 Yangilash", callback_data="latency_stats"))
+    builder.row(types.InlineKeyboardButton(text="⬅️ Orqaga", callback_data="main_menu"))
+
+    if not summary:
+        await callback.message.edit_text("ℹ️ Hali kechikish ma'lumotlari yo'q.", reply_markup=builder.as_markup())
+        return
+
+    names = {ch['channel_id']: ch['name'] for ch in await db.get_active_channels()}
+    # Busiest channels first; keep the message under Telegram's size limit
+    channels = sorted(summary.items(), key=lambda item: -item[1].get("total", (0,))[0])[:15]
+    text = "⏱ <b>Kechikishlar</b> (p50 / p95 / p99, ms):\n"
+    for ch_id, stages in channels:
+        count = stages.get("total", (0,))[0]
+        text += f"\n📢 <b>{html.escape(names.get(ch_id) or str(ch_id))}</b> (n={count})\n"
+        for stage in tracing.STAGES:
+            if stage in stages:
+                _, p50, p95, p99 = stages[stage]
+                text += f"• {stage}: {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f}\n"
+
+    # Slowest accounts by p95 of the total
+    accounts = sorted(tracing.recorder.account_summary().items(), key=lambda item: -item[1][2])[:10]
+    if accounts:
+        text += "\n👤 <b>Akkauntlar</b> (total):\n"
+        for account, (count, p50, p95, p99) in accounts:
+            text += f"• {html.escape(account)} (n={count}): {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f}\n"
+
+    try:
+        await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    except Exception:
+        # "message is not modified" when refreshed with no new samples
+        await callback.answer()
+
+# --- Send History ---
+async def render_history(hours):
+    outcomes, channels, accounts = await db.get_history_summary(timedelta(hours=hours))
+    builder = InlineKeyboardBuilder()
+    builder.row(*[
+        types.InlineKeyboardButton(text=f"• {label}" if h == hours else label, callback_data=f"history_{h}")
+        for h, label in HISTORY_PERIODS.items()
+    ])
+    builder.row(types.InlineKeyboardButton(text="⬅️ Orqaga", callback_data="main_menu"))
+
+    if not outcomes:
+        return f"ℹ️ Oxirgi {HISTORY_PERIODS[hours]} ichida kommentlar yuborilmagan.", builder.as_markup()
+
+    total = sum(row['sends'] for row in outcomes)
+    text = f"📊 <b>Statistika</b> (oxirgi {HISTORY_PERIODS[hours]})\n\nJami urinishlar: {total}\n"
+    for row in outcomes:
+        text += f"• {html.escape(row['outcome'])}: {row['sends']}\n"
+
+    text += "\n📢 <b>Kanallar</b> (yuborildi / urinish, p50 / p95 s):\n"
+    for row in channels:
+        name = html.escape(row['name'] or str(row['channel_id']))
+        delay = f", {row['p50']:.1f} / {row['p95']:.1f}" if row['p50'] is not None else ""
+        text += f"• {name}: {row['ok']} / {row['sends']}{delay}\n"
+
+    text += "\n👤 <b>Akkauntlar</b> (yuborildi / urinish):\n"
+    for row in accounts:
+        name = html.escape(row['name'] or f"ID: {row['account_id']}")
+        text += f"• {name}: {row['ok']} / {row['sends']}\n"
+    return text, builder.as_markup()
+
+@dp.callback_query(F.data.startswith("history_"))
+async def history_stats(callback: types.CallbackQuery):
+    hours = int(callback.data.split("_")[-1])
+    if hours not in HISTORY_PERIODS:
+        await callback.answer()
+        return
+    # Only expires with the TTL: the userbot writes this table, not the admin bot
+    text, markup = await views.get(("history", hours), lambda: render_history(hours))
+    try:
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    except Exception:
+        # "message is not modified" when the same period is picked again
+        await callback.answer()
+
+# --- View Cache ---
+class ViewCache:
+    """TTL/LRU cache of rendered admin screens, keyed like ("comments", ch_id, before).
+
+    Write handlers drop the keys they affect with invalidate(); the TTL only bounds
+    staleness from writes made elsewhere, e.g. the userbot adding restrictions.
+    """
+    def __init__(self, ttl=ADMIN_VIEW_TTL, max_size=256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.views = OrderedDict() # {key: (expires_at, view)}
+        self.generation = 0 # Bumped by invalidate so a render that raced a write is not stored
+
+    async def get(self, key, render):
+        """Cached view for `key`, or the result of `await render()`; None results are not cached"""
+        entry = self.views.get(key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            self.views.move_to_end(key)
+            metrics.admin_view_cache_total.inc(result="hit")
+            return entry[1]
+        metrics.admin_view_cache_total.inc(result="miss")
+        generation = self.generation
+        view = await render()
+        if view is not None and generation == self.generation:
+            self.views[key] = (now + self.ttl, view)
+            self.views.move_to_end(key)
+            while len(self.views) > self.max_size:
+                self.views.popitem(last=False)
+        return view
+
+    def invalidate(self, *prefix):
+        """Drops every key starting with `prefix`, e.g. ("comments", ch_id)"""
+        self.generation += 1
+        for key in [k for k in self.views if k[:len(prefix)] == prefix]:
+            del self.views[key]
+
+    def invalidate_channel(self, ch_id):
+        self.invalidate("channel", ch_id)
+        self.invalidate("comments", ch_id)
+
+views = ViewCache()
+
+# --- Pagination ---
+def add_page_nav(builder, prev_data, next_data):
+    """One row of ⬅️/➡️ buttons; a falsy callback data hides that side"""
+    buttons = []
+    if prev_data:
+        buttons.append(types.InlineKeyboardButton(text="⬅️ Oldingi", callback_data=prev_data))
+    if next_data:
+        buttons.append(types.InlineKeyboardButton(text="Keyingi ➡️", callback_data=next_data))
+    if buttons:
+        builder.row(*buttons)
+
 # --- Account Management ---
-@dp.callback_query(F.data == "manage_accounts")
-async def manage_accounts(callback: types.CallbackQuery):
-    accounts = await db.pool.fetch("SELECT id, name, phone, is_active FROM accounts ORDER BY id ASC")
+async def render_accounts(after):
+    accounts = await db.get_accounts_page(after, PAGE_SIZE + 1)
+    has_next, accounts = len(accounts) > PAGE_SIZE, accounts[:PAGE_SIZE]
     builder = InlineKeyboardBuilder()
     
     text = "👥 <b>Akkauntlar ro'yxati:</b>\n\n"
     if not accounts:
         text += "ℹ️ Hech qanday akkaunt topilmadi."
     else:
+        text += f"Jami: {await db.count_accounts()}"
         for acc in accounts:
             status = "✅" if acc['is_active'] else "❌"
             btn_text = f"{status} {acc['name'] or acc['phone']}"
-            builder.row(types.InlineKeyboardButton(text=btn_text, callback_data=f"toggle_acc_{acc['id']}"))
+            builder.row(types.InlineKeyboardButton(text=btn_text, callback_data=f"toggle_acc_{acc['id']}_{after}"))
+        add_page_nav(builder,
+                     after and f"acc_prev_{accounts[0]['id']}",
+                     has_next and f"acc_page_{accounts[-1]['id']}")
     
     builder.row(types.InlineKeyboardButton(text="⬅️ Orqaga", callback_data="main_menu"))
-    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    return text, builder.as_markup()
+
+async def show_accounts(callback: types.CallbackQuery, after=0):
+    text, markup = await views.get(("accounts", after), lambda: render_accounts(after))
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+
+@dp.callback_query(F.data == "manage_accounts")
+async def manage_accounts(callback: types.CallbackQuery):
+    await show_accounts(callback)
+
+@dp.callback_query(F.data.startswith("acc_page_"))
+async def accounts_page(callback: types.CallbackQuery):
+    await show_accounts(callback, int(callback.data.split("_")[-1]))
+
+@dp.callback_query(F.data.startswith("acc_prev_"))
+async def accounts_prev_page(callback: types.CallbackQuery):
+    first = int(callback.data.split("_")[-1])
+    after = await views.get(("accounts", "prev", first), lambda: db.get_accounts_cursor_before(first, PAGE_SIZE))
+    await show_accounts(callback, after)
 
 @dp.callback_query(F.data.startswith("toggle_acc_"))
 async def toggle_account(callback: types.CallbackQuery):
-    acc_id = int(callback.data.split("_")[-1])
-    current_status = await db.pool.fetchval("SELECT is_active FROM accounts WHERE id = $1", acc_id)
-    await db.toggle_account(acc_id, not current_status)
-    await manage_accounts(callback)
+    _, _, acc_id, after = callback.data.split("_")
+    current_status = await db.is_account_active(int(acc_id))
+    await db.toggle_account(int(acc_id), not current_status)
+    views.invalidate("accounts")
+    await show_accounts(callback, int(after))
 
 # --- Account Registration ---
-registration_clients = {}
+class LoginSessions:
+    """Pending account logins by admin user id, each holding a connected TelegramClient.
+
+    Every way out of the flow (success, failure, cancel, timeout) goes through
+    close(), which disconnects the client. A login untouched for `ttl` seconds is
+    closed by the reaper.
+    """
+    def __init__(self, ttl=REGISTRATION_TTL):
+        self.ttl = ttl
+        self.sessions = {} # {user_id: {"client", "phone", "phone_code_hash", "expires_at"}}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    async def open(self, user_id, client, phone, phone_code_hash):
+        await self.close(user_id) # A new login replaces an abandoned one
+        self.sessions[user_id] = {"client": client, "phone": phone, "phone_code_hash": phone_code_hash,
+                                  "expires_at": time.monotonic() + self.ttl}
+
+    def get(self, user_id):
+        """The pending login, with its TTL extended; None if there is none or it expired"""
+        session = self.sessions.get(user_id)
+        if session is None or session["expires_at"] <= time.monotonic():
+            return None
+        session["expires_at"] = time.monotonic() + self.ttl
+        return session
+
+    async def close(self, user_id):
+        session = self.sessions.pop(user_id, None)
+        if session:
+            try:
+                await session["client"].disconnect()
+            except Exception as e:
+                log.warning(f"⚠️ Login mijozi uzilmadi: {e}")
+
+    async def close_all(self):
+        for user_id in list(self.sessions):
+            await self.close(user_id)
+
+    async def reap(self):
+        now = time.monotonic()
+        expired = [user_id for user_id, session in self.sessions.items() if session["expires_at"] <= now]
+        for user_id in expired:
+            await self.close(user_id)
+        return len(expired)
+
+    async def run(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            expired = await self.reap()
+            if expired:
+                log.info(f"🧹 {expired} ta tugallanmagan login yopildi.")
+
+login_sessions = LoginSessions()
+metrics.registration_sessions.callback = lambda: len(login_sessions)
 
 @dp.callback_query(F.data == "add_account")
 async def add_account_btn(callback: types.CallbackQuery, state: FSMContext):
@@ -105,13 +355,11 @@ async def add_account_btn(callback: types.CallbackQuery, state: FSMContext):
 async def process_phone(message: types.Message, state: FSMContext):
     phone = message.text.strip()
     client = TelegramClient(StringSession(), API_ID, API_HASH)
-    await client.connect()
     
     try:
+        await client.connect()
         code_hash = await client.send_code_request(phone)
-        registration_clients[message.from_user.id] = {
-            "client": client, "phone": phone, "phone_code_hash": code_hash.phone_code_hash
-        }
+        await login_sessions.open(message.from_user.id, client, phone, code_hash.phone_code_hash)
         await message.answer("🔢 Telegramdan kelgan kodni yuboring:", reply_markup=get_cancel_kb())
         await state.set_state(Registration.waiting_for_code)
     except Exception as e:
@@ -122,7 +370,7 @@ async def process_phone(message: types.Message, state: FSMContext):
 @dp.message(Registration.waiting_for_code)
 async def process_code(message: types.Message, state: FSMContext):
     code = message.text.strip()
-    user_data = registration_clients.get(message.from_user.id)
+    user_data = login_sessions.get(message.from_user.id)
     if not user_data:
         await message.answer("❌ Seans topilmadi.", reply_markup=get_main_menu())
         await state.clear()
@@ -134,9 +382,9 @@ async def process_code(message: types.Message, state: FSMContext):
         session_str = client.session.save()
         me = await client.get_me()
         await db.add_account(session_str, (me.first_name or "") + " " + (me.last_name or ""), phone)
+        views.invalidate("accounts")
         await message.answer(f"✅ Akkaunt muvaffaqiyatli qo'shildi: {me.first_name}", reply_markup=get_main_menu())
-        await client.disconnect()
-        del registration_clients[message.from_user.id]
+        await login_sessions.close(message.from_user.id)
         await state.clear()
     except Exception as e:
         if "password" in str(e).lower():
@@ -144,44 +392,70 @@ async def process_code(message: types.Message, state: FSMContext):
             await state.set_state(Registration.waiting_for_password)
         else:
             await message.answer(f"❌ Xatolik: {e}", reply_markup=get_main_menu())
-            await client.disconnect()
+            await login_sessions.close(message.from_user.id)
             await state.clear()
 
 @dp.message(Registration.waiting_for_password)
 async def process_password(message: types.Message, state: FSMContext):
     password = message.text.strip()
-    user_data = registration_clients.get(message.from_user.id)
+    user_data = login_sessions.get(message.from_user.id)
+    if not user_data:
+        await message.answer("❌ Seans topilmadi.", reply_markup=get_main_menu())
+        await state.clear()
+        return
+
     client, phone = user_data["client"], user_data["phone"]
     try:
         await client.sign_in(password=password)
         session_str = client.session.save()
         me = await client.get_me()
         await db.add_account(session_str, (me.first_name or "") + " " + (me.last_name or ""), phone)
+        views.invalidate("accounts")
         await message.answer(f"✅ Akkaunt (2FA bilan) qo'shildi: {me.first_name}", reply_markup=get_main_menu())
-        await client.disconnect()
-        del registration_clients[message.from_user.id]
-        await state.clear()
     except Exception as e:
         await message.answer(f"❌ Xatolik: {e}", reply_markup=get_main_menu())
-        await client.disconnect()
+    finally:
+        await login_sessions.close(message.from_user.id)
         await state.clear()
 
 # --- Channel Management ---
-@dp.callback_query(F.data == "manage_channels")
-async def manage_channels(callback: types.CallbackQuery):
-    channels = await db.get_active_channels()
+async def render_channels(after):
+    channels = await db.get_channels_page(after, PAGE_SIZE + 1)
+    has_next, channels = len(channels) > PAGE_SIZE, channels[:PAGE_SIZE]
     builder = InlineKeyboardBuilder()
     
     text = "📢 <b>Kanallar ro'yxati:</b>\n\nKommentariya qo'shish yoki boshqarish uchun kanalni tanlang:"
     if not channels:
         text = "ℹ️ Hech qanday kanal topilmadi."
     else:
+        text += f"\nJami: {await db.count_channels()}"
         for ch in channels:
             builder.row(types.InlineKeyboardButton(text=f"• {ch['name']}", callback_data=f"view_ch_{ch['channel_id']}"))
+        add_page_nav(builder,
+                     after and f"ch_prev_{channels[0]['id']}",
+                     has_next and f"ch_page_{channels[-1]['id']}")
     
     builder.row(types.InlineKeyboardButton(text="➕ Yangi Kanal Qo'shish", callback_data="add_channel_start"))
     builder.row(types.InlineKeyboardButton(text="⬅️ Orqaga", callback_data="main_menu"))
-    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    return text, builder.as_markup()
+
+async def show_channels(callback: types.CallbackQuery, after=0):
+    text, markup = await views.get(("channels", after), lambda: render_channels(after))
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+
+@dp.callback_query(F.data == "manage_channels")
+async def manage_channels(callback: types.CallbackQuery):
+    await show_channels(callback)
+
+@dp.callback_query(F.data.startswith("ch_page_"))
+async def channels_page(callback: types.CallbackQuery):
+    await show_channels(callback, int(callback.data.split("_")[-1]))
+
+@dp.callback_query(F.data.startswith("ch_prev_"))
+async def channels_prev_page(callback: types.CallbackQuery):
+    first = int(callback.data.split("_")[-1])
+    after = await views.get(("channels", "prev", first), lambda: db.get_channels_cursor_before(first, PAGE_SIZE))
+    await show_channels(callback, after)
 
 @dp.callback_query(F.data == "add_channel_start")
 async def add_channel_start(callback: types.CallbackQuery, state: FSMContext):
@@ -221,6 +495,8 @@ async def process_channel_link_addition(message: types.Message, state: FSMContex
                     ch_name = entity.title
                 except: pass
             await db.add_channel(ch_id, ch_name)
+            views.invalidate("channels")
+            views.invalidate_channel(ch_id)
         finally: await client.disconnect()
 
         success, fail = 0, 0
@@ -243,63 +519,102 @@ async def process_channel_link_addition(message: types.Message, state: FSMContex
         await status_msg.edit_text("❌ Faol akkauntlar yo'q.", reply_markup=get_main_menu())
     await state.clear()
 
-@dp.callback_query(F.data.startswith("view_ch_"))
-async def view_channel_details(callback: types.CallbackQuery):
-    ch_id = int(callback.data.split("_")[-1])
-    channels = await db.get_active_channels()
-    channel = next((c for c in channels if c['channel_id'] == ch_id), None)
-    
+async def render_channel(ch_id):
+    channel = await db.get_channel(ch_id)
     if not channel:
-        await callback.answer("❌ Kanal topilmadi.")
-        return
+        return None
         
-    comments = await db.get_comments_for_channel(ch_id)
-    text = f"📢 <b>Kanal:</b> {html.escape(channel['name'])}\n🆔 <b>ID:</b> <code>{ch_id}</code>\n\n💬 <b>Kommentlar soni:</b> {len(comments)}"
+    comment_count = await db.count_comments(ch_id)
+    text = f"📢 <b>Kanal:</b> {html.escape(channel['name'])}\n🆔 <b>ID:</b> <code>{ch_id}</code>\n\n💬 <b>Kommentlar soni:</b> {comment_count}"
     
     builder = InlineKeyboardBuilder()
     builder.row(types.InlineKeyboardButton(text="➕ Komment Qo'shish", callback_data=f"add_comm_loop_{ch_id}"))
     builder.row(types.InlineKeyboardButton(text="� Kommentlarni Ko'rish", callback_data=f"list_comm_{ch_id}"))
+    builder.row(
+        types.InlineKeyboardButton(text="📥 Import", callback_data=f"import_comm_{ch_id}"),
+        types.InlineKeyboardButton(text="📤 CSV", callback_data=f"export_comm_csv_{ch_id}"),
+        types.InlineKeyboardButton(text="📤 JSON", callback_data=f"export_comm_json_{ch_id}"),
+    )
     builder.row(types.InlineKeyboardButton(text="�🗑 Kanalni o'chirish", callback_data=f"delete_ch_{ch_id}"))
     builder.row(types.InlineKeyboardButton(text="⬅️ Orqaga", callback_data="manage_channels"))
-    
-    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    return text, builder.as_markup()
 
-@dp.callback_query(F.data.startswith("list_comm_"))
-async def list_channel_comments(callback: types.CallbackQuery):
+@dp.callback_query(F.data.startswith("view_ch_"))
+async def view_channel_details(callback: types.CallbackQuery):
     ch_id = int(callback.data.split("_")[-1])
-    async with db.pool.acquire() as conn:
-        comments = await conn.fetch("SELECT id, text FROM comments WHERE channel_id = $1 ORDER BY id DESC", ch_id)
+    view = await views.get(("channel", ch_id), lambda: render_channel(ch_id))
     
-    if not comments:
-        await callback.answer("ℹ️ Kommentlar mavjud emas.")
+    if not view:
+        await callback.answer("❌ Kanal topilmadi.")
         return
+    
+    text, markup = view
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+
+async def render_comments(ch_id, before):
+    comments = await db.get_comments_page(ch_id, before, PAGE_SIZE + 1)
+    has_next, comments = len(comments) > PAGE_SIZE, comments[:PAGE_SIZE]
+    if not comments:
+        return None
         
-    text = f"📑 <b>Kanal uchun kommentlar ro'yxati:</b>\n(O'chirish uchun ustiga bosing)\n\n"
+    text = f"📑 <b>Kanal uchun kommentlar ro'yxati:</b>\n(O'chirish uchun ustiga bosing)\n\nJami: {await db.count_comments(ch_id)}"
     builder = InlineKeyboardBuilder()
     for comm in comments:
         # Show snippet of comment on button
         snippet = comm['text'][:30] + "..." if len(comm['text']) > 30 else comm['text']
-        builder.row(types.InlineKeyboardButton(text=f"🗑 {snippet}", callback_data=f"del_comm_{comm['id']}_{ch_id}"))
+        weight = f" ×{comm['weight']}" if comm['weight'] != 1 else ""
+        builder.row(types.InlineKeyboardButton(text=f"🗑{weight} {snippet}", callback_data=f"del_comm_{comm['id']}_{ch_id}_{before}"))
+    add_page_nav(builder,
+                 before and f"comm_prev_{ch_id}_{comments[0]['id']}",
+                 has_next and f"comm_page_{ch_id}_{comments[-1]['id']}")
     
     builder.row(types.InlineKeyboardButton(text="⬅️ Orqaga", callback_data=f"view_ch_{ch_id}"))
-    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    return text, builder.as_markup()
+
+async def show_comments(callback: types.CallbackQuery, ch_id, before=0):
+    view = await views.get(("comments", ch_id, before), lambda: render_comments(ch_id, before))
+    
+    if not view:
+        if before: # The page emptied out (e.g. its last comment was deleted), go back to the start
+            return await show_comments(callback, ch_id)
+        await callback.answer("ℹ️ Kommentlar mavjud emas.")
+        return
+    
+    text, markup = view
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+
+@dp.callback_query(F.data.startswith("list_comm_"))
+async def list_channel_comments(callback: types.CallbackQuery):
+    await show_comments(callback, int(callback.data.split("_")[-1]))
+
+@dp.callback_query(F.data.startswith("comm_page_"))
+async def comments_page(callback: types.CallbackQuery):
+    _, _, ch_id, before = callback.data.split("_")
+    await show_comments(callback, int(ch_id), int(before))
+
+@dp.callback_query(F.data.startswith("comm_prev_"))
+async def comments_prev_page(callback: types.CallbackQuery):
+    _, _, ch_id, first = callback.data.split("_")
+    ch_id, first = int(ch_id), int(first)
+    before = await views.get(("comments", ch_id, "prev", first), lambda: db.get_comments_cursor_before(ch_id, first, PAGE_SIZE))
+    await show_comments(callback, ch_id, before)
 
 @dp.callback_query(F.data.startswith("del_comm_"))
 async def delete_comment_handler(callback: types.CallbackQuery):
-    parts = callback.data.split("_")
-    comm_id = int(parts[2])
-    ch_id = int(parts[3])
+    _, _, comm_id, ch_id, before = callback.data.split("_")
     
-    async with db.pool.acquire() as conn:
-        await conn.execute("DELETE FROM comments WHERE id = $1", comm_id)
+    await db.delete_comment(int(comm_id))
+    views.invalidate_channel(int(ch_id))
     
     await callback.answer("✅ Komment o'chirildi.")
-    await list_channel_comments(callback)
+    await show_comments(callback, int(ch_id), int(before))
 
 @dp.callback_query(F.data.startswith("delete_ch_"))
 async def delete_channel(callback: types.CallbackQuery):
     ch_id = int(callback.data.split("_")[-1])
-    await db.pool.execute("DELETE FROM channels WHERE channel_id = $1", ch_id)
+    await db.delete_channel(ch_id)
+    views.invalidate("channels")
+    views.invalidate_channel(ch_id)
     await callback.answer("✅ Kanal o'chirildi.")
     await manage_channels(callback)
 
@@ -330,6 +645,7 @@ async def confirm_comment_yes(callback: types.CallbackQuery, state: FSMContext):
     text = data['temp_text']
     
     await db.add_comment(ch_id, text)
+    views.invalidate_channel(ch_id)
     await callback.answer("✅ Saqlandi!")
     
     # Prompt for next comment automatically
@@ -341,6 +657,119 @@ async def confirm_comment_no(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_text("🔄 Qayta yozing:\n\n💬 <b>Komment matnini yuboring:</b>", reply_markup=get_cancel_kb(), parse_mode="HTML")
     await state.set_state(CommentAddition.waiting_for_text)
 
+# --- Bulk Comment Import/Export ---
+def parse_comments(filename, data):
+    """(text, weight) pairs from an uploaded .txt (one per line), .csv or .json file; weight may be None"""
+    content = data.decode("utf-8-sig")
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".json":
+        items = json.loads(content)
+        if isinstance(items, dict):
+            items = items.get("comments", [])
+        if not isinstance(items, list):
+            raise ValueError("JSON ro'yxat bo'lishi kerak")
+        entries = [(item.get("text"), item.get("weight")) if isinstance(item, dict) else (item, None) for item in items]
+    elif ext == ".csv":
+        rows = [row for row in csv.reader(io.StringIO(content)) if row]
+        column, weight_column = 0, None
+        if rows and "text" in rows[0]: # Header written by the export
+            column = rows[0].index("text")
+            weight_column = rows[0].index("weight") if "weight" in rows[0] else None
+            rows = rows[1:]
+        entries = [(row[column] if column < len(row) else None,
+                    row[weight_column] if weight_column is not None and weight_column < len(row) else None)
+                   for row in rows]
+    else:
+        entries = [(line, None) for line in content.splitlines()]
+    return [(text, weight) for text, weight in entries if isinstance(text, str)]
+
+def clean_comments(entries):
+    """Strips, validates and dedupes; returns ({text: weight}, rejected count)"""
+    valid, rejected = {}, 0
+    for text, weight in entries:
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            weight = 1 if weight in (None, "") else int(weight)
+        except (TypeError, ValueError):
+            weight = 0
+        if len(text) > MAX_COMMENT_LENGTH or not 1 <= weight <= MAX_COMMENT_WEIGHT:
+            rejected += 1
+            continue
+        valid[text] = weight
+    return valid, rejected
+
+def export_comments(comments, fmt):
+    if fmt == "json":
+        return json.dumps([{"id": c['id'], "text": c['text'], "weight": c['weight']} for c in comments],
+                          ensure_ascii=False, indent=2).encode()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("id", "text", "weight"))
+    writer.writerows((c['id'], c['text'], c['weight']) for c in comments)
+    return buffer.getvalue().encode("utf-8-sig") # BOM so Excel picks UTF-8
+
+@dp.callback_query(F.data.startswith("import_comm_"))
+async def import_comments_start(callback: types.CallbackQuery, state: FSMContext):
+    ch_id = int(callback.data.split("_")[-1])
+    await state.update_data(ch_id=ch_id)
+    await callback.message.edit_text(
+        "📥 <b>Kommentlar faylini yuboring</b> (.txt, .csv yoki .json):\n\n"
+        "• .txt — har bir qatorda bitta komment\n"
+        "• .csv — birinchi ustun yoki <code>text</code> (va ixtiyoriy <code>weight</code>) ustuni\n"
+        "• .json — matnlar ro'yxati yoki <code>{\"text\": ..., \"weight\": 2}</code> obyektlari\n\n"
+        f"Vazn (weight) 1–{MAX_COMMENT_WEIGHT}: kattaroq vaznli komment ko'proq tanlanadi. "
+        "Yaqinda yuborilgan kommentlar qayta tanlanmaydi, shuning uchun ulushlar vaznga taxminan mutanosib; "
+        "juda katta vaznlar bu takrorlanish oynasini qisqartiradi.",
+        reply_markup=get_cancel_kb(), parse_mode="HTML")
+    await state.set_state(CommentImport.waiting_for_file)
+
+@dp.message(CommentImport.waiting_for_file)
+async def process_comment_import(message: types.Message, state: FSMContext):
+    document = message.document
+    if not document:
+        await message.answer("❌ Fayl yuboring.", reply_markup=get_cancel_kb())
+        return
+    if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+        await message.answer(f"❌ Fayl juda katta (maks. {MAX_IMPORT_BYTES // 1024 // 1024} MB).", reply_markup=get_cancel_kb())
+        return
+
+    ch_id = (await state.get_data())['ch_id']
+    buffer = await bot.download(document, destination=io.BytesIO())
+    try:
+        comments, rejected = clean_comments(parse_comments(document.file_name, buffer.getvalue()))
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        await message.answer(f"❌ Faylni o'qib bo'lmadi: {html.escape(str(e))}", reply_markup=get_cancel_kb(), parse_mode="HTML")
+        return
+
+    try:
+        added, reweighted = await db.import_comments(ch_id, comments)
+        views.invalidate_channel(ch_id)
+    except asyncpg.ForeignKeyViolationError:
+        await message.answer("❌ Kanal topilmadi.", reply_markup=get_main_menu())
+        await state.clear()
+        return
+
+    builder = InlineKeyboardBuilder()
+    builder.row(types.InlineKeyboardButton(text="⬅️ Kanalga qaytish", callback_data=f"view_ch_{ch_id}"))
+    await message.answer(
+        f"✅ Import yakunlandi:\n➕ Qo'shildi: {added}\n⚖️ Vazni yangilandi: {reweighted}\n"
+        f"♻️ Takroriy: {len(comments) - added - reweighted}\n❌ Yaroqsiz: {rejected}",
+        reply_markup=builder.as_markup())
+    await state.clear()
+
+@dp.callback_query(F.data.startswith("export_comm_"))
+async def export_channel_comments(callback: types.CallbackQuery):
+    _, _, fmt, ch_id = callback.data.split("_")
+    comments = (await db.get_channel_comments(int(ch_id)))[::-1] # Oldest first, the order an import recreates
+    if not comments:
+        await callback.answer("ℹ️ Kommentlar mavjud emas.")
+        return
+    document = types.BufferedInputFile(export_comments(comments, fmt), filename=f"comments_{ch_id}.{fmt}")
+    await callback.message.answer_document(document, caption=f"📤 {len(comments)} ta komment")
+    await callback.answer()
+
 # --- Bulk Join ---
 @dp.callback_query(F.data == "join_all_start")
 async def join_all_start(callback: types.CallbackQuery, state: FSMContext):
@@ -370,8 +799,13 @@ async def process_join_all_link(message: types.Message, state: FSMContext):
     await state.clear()
 
 async def admin_bot_main():
-    await db.connect()
-    await dp.start_polling(bot)
+    supervisor.on_close(db.close)
+    await supervisor.retry("admin_db_connect", db.connect)
+    supervisor.on_close(login_sessions.close_all)
+    supervisor.spawn("login_reaper", login_sessions.run, restart=True)
+    # Signals belong to the supervisor, which cancels polling on shutdown
+    await dp.start_polling(bot, handle_signals=False)
 
 if __name__ == "__main__":
-    asyncio.run(admin_bot_main())
+    logs.setup()
+    asyncio.run(supervisor.run(("admin_bot", admin_bot_main)))
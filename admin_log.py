@@ -0,0 +1,114 @@
+import os
+import asyncio
+import logging
+import aiohttp
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+MAX_MESSAGE_LENGTH = 4096 # Telegram's limit for one text message
+
+log = logging.getLogger("admin_log")
+
+class AdminLog:
+    """Bounded queue of admin log lines, merged into digests by a single consumer.
+
+    send() never blocks: when the queue is full the line is dropped and counted.
+    run() delivers digests of up to MAX_MESSAGE_LENGTH characters, flushing when a
+    digest is full or `flush_interval` seconds after its first line, and waits out
+    the `retry_after` the Bot API returns with a 429.
+    """
+
+    def __init__(self, token, chat_id, api_url=TELEGRAM_API_URL, max_queue=1000, flush_interval=2.0, max_attempts=5):
+        self.url = f"{api_url}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.queued = 0 # Lines accepted
+        self.dropped = 0 # Lines rejected because the queue was full, or lost after retries
+        self.sent = 0 # Digests delivered
+        self.throttled = 0 # 429 responses honored
+        self.carried = None # Line held over for the next digest
+
+    def send(self, text: str):
+        try:
+            self.queue.put_nowait(text[:MAX_MESSAGE_LENGTH])
+            self.queued += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def stats(self):
+        return {"queued": self.queued, "pending": self.queue.qsize() + (self.carried is not None), "dropped": self.dropped,
+                "sent": self.sent, "throttled": self.throttled}
+
+    async def run(self, session: aiohttp.ClientSession):
+        """Consumer loop; run exactly one per AdminLog"""
+        loop = asyncio.get_running_loop()
+        while True:
+            # A line that didn't fit the previous digest starts this one
+            carried, self.carried = self.carried, None
+            lines = [carried if carried is not None else await self.queue.get()]
+            size = len(lines[0])
+            deadline = loop.time() + self.flush_interval
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    line = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if size + 2 + len(line) > MAX_MESSAGE_LENGTH:
+                    self.carried = line # Taken from the queue, marked done once its digest is flushed
+                    break
+                lines.append(line)
+                size += len(line) + 2
+            try:
+                await self.flush(session, lines)
+            finally:
+                for _ in lines:
+                    self.queue.task_done()
+
+    async def drain(self):
+        """Waits until every queued line was delivered or given up on"""
+        await self.queue.join()
+
+    async def flush(self, session, lines):
+        for digest, count in self.digests(lines):
+            if not await self.deliver(session, digest):
+                self.dropped += count
+
+    @staticmethod
+    def digests(lines):
+        """Joins lines with blank lines into (text, line_count) chunks no longer than MAX_MESSAGE_LENGTH"""
+        chunk = []
+        size = 0
+        for line in lines:
+            if chunk and size + 2 + len(line) > MAX_MESSAGE_LENGTH:
+                yield "\n\n".join(chunk), len(chunk)
+                chunk, size = [], 0
+            size += len(line) + (2 if chunk else 0)
+            chunk.append(line)
+        if chunk:
+            yield "\n\n".join(chunk), len(chunk)
+
+    async def deliver(self, session, text):
+        data = {"chat_id": self.chat_id, "text": text}
+        for attempt in range(self.max_attempts):
+            try:
+                async with session.post(self.url, data=data) as resp:
+                    if resp.status == 200:
+                        self.sent += 1
+                        return True
+                    if resp.status == 429:
+                        body = await resp.json(content_type=None)
+                        retry_after = body.get("parameters", {}).get("retry_after", 5)
+                        self.throttled += 1
+                        await asyncio.sleep(retry_after)
+                        continue
+                    log.warning(f"⚠️ Admin logda xato: {resp.status}")
+                    if resp.status < 500:
+                        return False
+            except Exception as e:
+                log.warning(f"⚠️ Admin log yuborilmadi: {e}")
+            await asyncio.sleep(2 ** attempt)
+        return False
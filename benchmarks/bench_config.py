@@ -0,0 +1,79 @@
+"""Measures Database.get_all_config refresh time against channel/comment count.
+
+Runs against a scratch Postgres database given by BENCH_DATABASE_URL. All tables
+are created inside a throwaway schema, which is dropped afterwards.
+
+    BENCH_DATABASE_URL=postgres://... python -m benchmarks.bench_config
+"""
+import os
+import time
+import asyncio
+import asyncpg
+from database import Database
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+SCHEMA = "auto_reply_bench"
+SIZES = [(10, 10), (100, 10), (300, 10), (300, 50), (1000, 20)]  # (channels, comments per channel)
+ROUNDS = 5
+
+
+async def legacy_get_all_config(db):
+    """The previous N+1 implementation, kept here as the baseline"""
+    async with db.pool.acquire() as conn:
+        channels = await conn.fetch("SELECT channel_id FROM channels WHERE is_active = TRUE")
+        config = {}
+        for ch in channels:
+            comments = await db.get_channel_comments(ch['channel_id'])
+            if comments:
+                config[ch['channel_id']] = [(c['id'], c['text'], c['weight']) for c in reversed(comments)]
+        return config
+
+
+async def seed(db, n_channels, n_comments):
+    async with db.pool.acquire() as conn:
+        await conn.execute("TRUNCATE channels, comments RESTART IDENTITY CASCADE")
+        await conn.executemany(
+            "INSERT INTO channels (channel_id, name) VALUES ($1, $2)",
+            [(-1000000000000 - i, f"bench {i}") for i in range(n_channels)]
+        )
+        await conn.executemany(
+            "INSERT INTO comments (channel_id, text) VALUES ($1, $2)",
+            [(-1000000000000 - i, f"comment {i}/{j}") for i in range(n_channels) for j in range(n_comments)]
+        )
+
+
+async def timed(fn, db):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        await fn(db)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def main():
+    if not BENCH_DATABASE_URL:
+        raise SystemExit("BENCH_DATABASE_URL o'rnatilmagan.")
+
+    admin = await asyncpg.connect(BENCH_DATABASE_URL)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    sep = "&" if "?" in BENCH_DATABASE_URL else "?"
+    db = Database()
+    try:
+        await db.connect(f"{BENCH_DATABASE_URL}{sep}search_path={SCHEMA}")
+        print(f"{'channels':>8} {'comments':>8} {'legacy ms':>10} {'single ms':>10} {'speedup':>8}")
+        for n_channels, n_comments in SIZES:
+            await seed(db, n_channels, n_comments)
+            assert await legacy_get_all_config(db) == await db.get_all_config()
+            legacy = await timed(legacy_get_all_config, db)
+            single = await timed(Database.get_all_config, db)
+            print(f"{n_channels:>8} {n_channels * n_comments:>8} {legacy:>10.1f} {single:>10.1f} {legacy / single:>7.1f}x")
+    finally:
+        if db.pool:
+            await db.pool.close()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
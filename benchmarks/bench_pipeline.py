@@ -0,0 +1,116 @@
+"""End-to-end userbot benchmark on a fake Telegram transport and an in-memory database.
+
+Starts the real run_client / Dispatcher / send_comment code for N simulated
+accounts, emits synthetic posts at a fixed rate and reports send throughput,
+handler latency percentiles, traced memory per account and cache refresh cost.
+
+    python -m benchmarks.bench_pipeline --accounts 50 --channels 20 --posts 200 --rate 20
+"""
+import os
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+# main.py reads these at import time; nothing here talks to Telegram or Postgres
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "bench")
+
+import main
+import entities
+import history
+import tracing
+from tracing import percentile
+from benchmarks.fakes import FakeTelegram, MemoryDatabase
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--comments", type=int, default=20, help="comments per channel")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=20, help="posts per second")
+    parser.add_argument("--album-size", type=int, default=1, help="messages per post (media album)")
+    parser.add_argument("--send-latency", type=float, default=0.05, help="fake send_message latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="fraction of sends that fail")
+    parser.add_argument("--turn-delay", type=float, default=0.0, help="overrides main.TURN_DELAY")
+    parser.add_argument("--stagger", type=float, default=0.0, help="overrides STARTUP_STAGGER")
+    parser.add_argument("--refresh-rounds", type=int, default=20)
+    return parser.parse_args()
+
+
+def report_latency(stage):
+    values = []
+    for (channel_id, name), samples in tracing.recorder.samples.items():
+        if name == stage:
+            values.extend(samples)
+    if not values:
+        return f"{stage:>8}: no samples"
+    values.sort()
+    p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.50, 0.95, 0.99))
+    return f"{stage:>8}: p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  p99 {p99:8.1f} ms  (n={len(values)})"
+
+
+async def run(args):
+    channel_ids = [-1000000000000 - i for i in range(args.channels)]
+    database = MemoryDatabase(channel_ids, args.comments, args.accounts)
+    telegram = FakeTelegram(send_latency=args.send_latency, error_rate=args.error_rate)
+    main.db = entities.db = history.db = database
+    main.make_client = telegram.client
+    main.TURN_DELAY = args.turn_delay
+    main.startup.stagger = args.stagger
+    main.TURN_JITTER = (0.0, 0.0) if args.turn_delay == 0 else main.TURN_JITTER
+
+    await main.update_cache()
+    refresh = []
+    for _ in range(args.refresh_rounds):
+        start = time.perf_counter()
+        await main.update_cache()
+        refresh.append(time.perf_counter() - start)
+
+    accounts = await database.get_active_accounts()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    main.dispatcher.total_accounts = len(accounts)
+    main.startup.begin(len(accounts))
+    start = time.perf_counter()
+    runners = [asyncio.create_task(main.run_client(acc['id'], acc['session_string'], idx))
+               for idx, acc in enumerate(accounts)]
+    await main.startup.fleet_ready.wait()
+    ready_seconds = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    per_account = sum(s.size_diff for s in after.compare_to(before, "filename")) / len(accounts)
+
+    start = time.perf_counter()
+    await telegram.emit_posts(channel_ids, args.posts, args.rate, args.album_size)
+    while main.dispatcher.pending:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    accounts_seen = list(main.dispatcher.accounts.values())
+    for client in telegram.clients:
+        await client.disconnect()
+    await asyncio.gather(*runners)
+
+    attempts = telegram.sent + telegram.errors
+    print(f"accounts={args.accounts} channels={args.channels} posts={args.posts} rate={args.rate}/s album={args.album_size} "
+          f"send_latency={args.send_latency}s error_rate={args.error_rate}")
+    print(f"fleet ready:      {ready_seconds * 1000:.1f} ms")
+    print(f"memory/account:   {per_account / 1024:.1f} KiB (tracemalloc, startup)")
+    print(f"sends:            {telegram.sent} ok, {telegram.errors} failed, {attempts / elapsed:.1f} attempts/s")
+    dropped = {}
+    for account in accounts_seen:
+        for reason, n in account.queue.dropped.items():
+            dropped[reason] = dropped.get(reason, 0) + n
+    print(f"dropped posts:    {dropped or 'none'}")
+    await main.history.flush()
+    print(f"history rows:     {len(database.comment_log)} written in one batch")
+    print(f"cache refresh:    {sorted(refresh)[len(refresh) // 2] * 1000:.2f} ms median (full reload)")
+    for stage in tracing.STAGES:
+        print(report_latency(stage))
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
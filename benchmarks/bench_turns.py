@@ -0,0 +1,49 @@
+"""Measures the CPU cost of computing comment turns for one post across all accounts.
+
+Every account's handler asks for its own position. The legacy path shuffles the
+full account list in each handler; TurnOrder shuffles once per post.
+
+    python -m benchmarks.bench_turns
+"""
+import os
+import time
+import random
+
+# main.py reads these at import time; the benchmark never talks to Telegram
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "bench")
+
+from main import TurnOrder
+
+ACCOUNT_COUNTS = [5, 20, 50, 100, 300, 1000]
+POSTS = 200
+
+
+def legacy_position(post_id, account_index, total_accounts):
+    rng = random.Random(post_id)
+    order = list(range(total_accounts))
+    rng.shuffle(order)
+    return order.index(account_index)
+
+
+def per_post_cpu_us(position, total_accounts):
+    start = time.process_time()
+    for post_id in range(POSTS):
+        for account_index in range(total_accounts):
+            position(post_id, account_index, total_accounts)
+    return (time.process_time() - start) / POSTS * 1e6
+
+
+def main():
+    print(f"{'accounts':>8} {'legacy us/post':>15} {'shared us/post':>15} {'speedup':>8}")
+    for total in ACCOUNT_COUNTS:
+        turns = TurnOrder()
+        shared = lambda post_id, idx, n: turns.position(-100, post_id, idx, n)
+        assert all(shared(7, i, total) == legacy_position(7, i, total) for i in range(total))
+        legacy_us = per_post_cpu_us(legacy_position, total)
+        shared_us = per_post_cpu_us(shared, total)
+        print(f"{total:>8} {legacy_us:>15.1f} {shared_us:>15.1f} {legacy_us / shared_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
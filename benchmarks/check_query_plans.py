@@ -0,0 +1,90 @@
+"""Checks that the hot userbot/admin queries are served by indexes.
+
+Applies the migrations to a throwaway schema in BENCH_DATABASE_URL, seeds a
+little data and EXPLAINs each query with sequential scans disabled: if the
+planner still picks a Seq Scan, no usable index exists. Exits non-zero on
+any failure, so it can gate a deploy.
+
+    BENCH_DATABASE_URL=postgres://... python -m benchmarks.check_query_plans
+"""
+import os
+import sys
+import json
+import asyncio
+import asyncpg
+from datetime import datetime, timedelta, timezone
+from database import Database, QUERIES
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+SCHEMA = "auto_reply_plans"
+NOW = datetime.now(timezone.utc)
+
+# (name, SQL, args): the statements the hot paths run, straight from QUERIES. Plain
+# EXPLAIN only plans them, so the DML entries never touch the seeded rows.
+HOT_QUERIES = [
+    ("comments by channel", QUERIES["channel_comment_texts"], (-1000000000001,)),
+    ("comments page", QUERIES["comments_page"], (-1000000000001, 4000, 11)),
+    ("previous comments page", QUERIES["comments_before"], (-1000000000001, 1000, 11)),
+    ("comment count", QUERIES["comment_count"], (-1000000000001,)),
+    ("channel by id", QUERIES["channel"], (-1000000000001,)),
+    ("channels page", QUERIES["channels_page"], (100, 11)),
+    ("channel delta", QUERIES["changed_channels"], (NOW,)),
+    ("tombstone delta", QUERIES["deleted_channels"], (NOW,)),
+    ("restriction delta", QUERIES["changed_restrictions"], (NOW,)),
+    ("restriction upsert", QUERIES["add_restriction"], (1, -1000000000001, None)),
+    ("active restrictions", QUERIES["active_restrictions"], ()),
+    ("expired restrictions", QUERIES["delete_expired_restrictions"], ()),
+    ("access hashes", QUERIES["access_hashes"], ()),
+    ("account status", QUERIES["account_is_active"], (1,)),
+    ("send history window", QUERIES["history_outcomes"], (timedelta(hours=24),)),
+    ("send history channels", QUERIES["history_channels"], (timedelta(hours=24), 10)),
+    ("send history pruning", QUERIES["prune_comment_log"], (timedelta(days=30),)),
+]
+
+
+def seq_scans(plan):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+async def seed(db):
+    async with db.acquire() as conn:
+        await conn.execute("INSERT INTO accounts (session_string, name) SELECT 'bench-' || i, 'Bench' FROM generate_series(1, 50) i")
+        await conn.execute("INSERT INTO channels (channel_id, name) SELECT -1000000000000 - i, 'bench' FROM generate_series(1, 200) i")
+        await conn.execute("INSERT INTO comments (channel_id, text) SELECT -1000000000000 - (i % 200) - 1, 'c' || i FROM generate_series(1, 5000) i")
+        await conn.execute("ANALYZE")
+
+
+async def main():
+    if not BENCH_DATABASE_URL:
+        raise SystemExit("BENCH_DATABASE_URL o'rnatilmagan.")
+
+    admin = await asyncpg.connect(BENCH_DATABASE_URL)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    sep = "&" if "?" in BENCH_DATABASE_URL else "?"
+    db = Database()
+    failures = 0
+    try:
+        await db.connect(f"{BENCH_DATABASE_URL}{sep}search_path={SCHEMA}")
+        await seed(db)
+        async with db.acquire() as conn:
+            await conn.execute("SET enable_seqscan = off")
+            for name, sql, args in HOT_QUERIES:
+                plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args))[0]["Plan"]
+                scans = sorted(set(seq_scans(plan)))
+                status = "FAIL seq scan on " + ", ".join(scans) if scans else "ok"
+                failures += bool(scans)
+                print(f"{name:<24} {plan['Node Type']:<18} {status}")
+            await conn.execute("RESET enable_seqscan")
+    finally:
+        if db.pool:
+            await db.pool.close()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,182 @@
+"""In-process stand-ins for Telegram and Postgres used by the offline benchmarks.
+
+FakeTelegram plays the server: it owns one FakeClient per account, emits
+synthetic NewMessage events to every client at a fixed rate, and acknowledges
+send_message after a configurable latency, failing a configurable fraction.
+MemoryDatabase implements the subset of database.Database the userbot uses.
+"""
+import random
+import asyncio
+from datetime import datetime, timezone
+
+
+class FakeEntity:
+    def __init__(self, channel_id, title):
+        self.id = channel_id
+        self.title = title
+        self.access_hash = abs(hash(channel_id)) % (1 << 62)
+
+
+class FakeUser:
+    def __init__(self, index):
+        self.first_name = f"Bench{index}"
+        self.last_name = None
+
+
+class FakeSession:
+    def __init__(self, session_str):
+        self.session_str = session_str
+
+    def save(self):
+        return self.session_str
+
+
+class FakeMessage:
+    """Only the attributes the userbot reads from a NewMessage event"""
+
+    def __init__(self, client, chat_id, post_id, grouped_id=None):
+        self.client = client
+        self.chat_id = chat_id
+        self.id = post_id
+        self.grouped_id = grouped_id
+        self.date = datetime.now(timezone.utc)
+
+
+class FakeSendError(Exception):
+    pass
+
+
+class FakeClient:
+    def __init__(self, server, session_str):
+        self.server = server
+        self.session = FakeSession(session_str)
+        self.handlers = [] # [(callback, event builder)]
+        self.disconnected = asyncio.Event()
+        self.sent = 0
+
+    async def connect(self):
+        await asyncio.sleep(self.server.connect_latency)
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_me(self):
+        return FakeUser(self.server.clients.index(self))
+
+    def add_event_handler(self, callback, builder):
+        self.handlers.append((callback, builder))
+
+    def remove_event_handler(self, callback):
+        before = len(self.handlers)
+        self.handlers = [(cb, b) for cb, b in self.handlers if cb != callback]
+        return before - len(self.handlers)
+
+    async def get_entity(self, channel_id):
+        return FakeEntity(channel_id, f"Kanal {channel_id}")
+
+    async def get_input_entity(self, channel_id):
+        return FakeEntity(channel_id, None)
+
+    async def send_message(self, entity, message, comment_to=None):
+        await asyncio.sleep(self.server.send_latency)
+        if self.server.rng.random() < self.server.error_rate:
+            self.server.errors += 1
+            raise FakeSendError("bench: injected send failure")
+        self.sent += 1
+        self.server.sent += 1
+
+    def deliver(self, event):
+        for callback, builder in list(self.handlers):
+            chats = getattr(builder, "chats", None)
+            if chats is None or event.chat_id in chats:
+                asyncio.create_task(callback(event))
+
+    async def run_until_disconnected(self):
+        await self.disconnected.wait()
+
+    async def disconnect(self):
+        self.disconnected.set()
+
+
+class FakeTelegram:
+    def __init__(self, send_latency=0.05, error_rate=0.0, connect_latency=0.01, seed=1):
+        self.send_latency = send_latency
+        self.error_rate = error_rate
+        self.connect_latency = connect_latency
+        self.rng = random.Random(seed)
+        self.clients = []
+        self.sent = 0
+        self.errors = 0
+
+    def client(self, session_str):
+        client = FakeClient(self, session_str)
+        self.clients.append(client)
+        return client
+
+    async def emit_posts(self, channel_ids, posts, rate, album_size=1):
+        """Publishes `posts` posts round-robin over the channels at `rate` posts per second;
+        with album_size > 1 each post is an album of that many messages sharing a grouped_id"""
+        interval = 1 / rate
+        for post in range(1, posts + 1):
+            chat_id = channel_ids[post % len(channel_ids)]
+            grouped_id = post if album_size > 1 else None
+            for i in range(album_size):
+                for client in self.clients:
+                    client.deliver(FakeMessage(client, chat_id, (post - 1) * album_size + i + 1, grouped_id))
+            await asyncio.sleep(interval)
+
+
+class MemoryDatabase:
+    """The database.Database calls the userbot makes, backed by dicts"""
+
+    def __init__(self, channels, comments_per_channel, accounts):
+        self.config = {ch: [(n * comments_per_channel + i + 1, f"bench comment {ch}/{i}", 1)
+                            for i in range(comments_per_channel)]
+                       for n, ch in enumerate(channels)}
+        self.accounts = [{"id": i + 1, "session_string": f"bench-session-{i}", "name": f"Bench{i}"}
+                         for i in range(accounts)]
+        self.titles = {}
+        self.hashes = {}
+        self.comment_log = []
+
+    async def connect(self, dsn=None):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_now(self):
+        return datetime.now(timezone.utc)
+
+    async def get_active_accounts(self):
+        return self.accounts
+
+    async def get_all_config(self):
+        return {ch: list(comments) for ch, comments in self.config.items()}
+
+    async def get_all_restrictions(self):
+        return []
+
+    async def get_changes_since(self, since):
+        return datetime.now(timezone.utc), {}, set(), []
+
+    async def listen_changes(self, callback, heartbeat=30):
+        await asyncio.Event().wait()
+
+    async def add_restriction(self, account_id, channel_id, until_date=None):
+        pass
+
+    async def get_entity_titles(self):
+        return dict(self.titles)
+
+    async def save_entity_titles(self, titles):
+        self.titles.update(titles)
+
+    async def get_access_hashes(self):
+        return dict(self.hashes)
+
+    async def save_access_hashes(self, hashes):
+        self.hashes.update(hashes)
+
+    async def write_comment_log(self, rows):
+        self.comment_log.extend(rows)
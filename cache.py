@@ -0,0 +1,158 @@
+import math
+import time
+import heapq
+import asyncio
+from datetime import timezone
+
+
+class Snapshot:
+    """One consistent, never-mutated view of the cache; handlers keep it for a whole event"""
+    __slots__ = ("version", "channels_config")
+
+    def __init__(self, version, channels_config):
+        self.version = version
+        self.channels_config = channels_config # {channel_id: [(id, text, weight)]}
+
+
+class RestrictionIndex:
+    """Blocked (account, channel) pairs keyed by small integer ids, expired by a min-heap timer.
+
+    Accounts are identified by accounts.id; channel ids are interned into small
+    slots the first time they are restricted, so a lookup is two dict hits and
+    no datetime work. run() pops entries off the heap as they expire.
+    """
+
+    def __init__(self):
+        self.slots = {} # {channel_id: small int}
+        self.blocked = {} # {account_id << 32 | slot: until timestamp, inf if permanent}
+        self.heap = [] # [(until timestamp, key)], may hold stale entries
+        self.changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self.blocked)
+
+    def key(self, account_id, channel_id):
+        slot = self.slots.get(channel_id)
+        if slot is None:
+            slot = self.slots[channel_id] = len(self.slots)
+        return account_id << 32 | slot
+
+    @staticmethod
+    def timestamp(until):
+        if until is None:
+            return math.inf
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc) # Stored as UTC
+        return until.timestamp()
+
+    def is_blocked(self, account_id, channel_id):
+        slot = self.slots.get(channel_id)
+        return slot is not None and (account_id << 32 | slot) in self.blocked
+
+    def block(self, account_id, channel_id, until=None):
+        until_ts = self.timestamp(until)
+        if until_ts <= time.time():
+            return
+        key = self.key(account_id, channel_id)
+        self.blocked[key] = until_ts
+        if until_ts != math.inf:
+            heapq.heappush(self.heap, (until_ts, key))
+            if self.heap[0][1] == key:
+                self.changed.set() # New earliest expiry, reschedule the timer
+
+    def unblock(self, account_id, channel_id):
+        slot = self.slots.get(channel_id)
+        if slot is not None:
+            self.blocked.pop(account_id << 32 | slot, None)
+
+    def entries(self):
+        """(account_id, channel_id, until timestamp) for every blocked pair"""
+        channels = {slot: channel_id for channel_id, slot in self.slots.items()}
+        return [(key >> 32, channels[key & 0xFFFFFFFF], until) for key, until in self.blocked.items()]
+
+    def load(self, rows):
+        """Replaces the index with (account_id, channel_id, until_date) rows"""
+        self.blocked = {}
+        self.heap = []
+        self.update(rows)
+        self.changed.set()
+
+    def update(self, rows):
+        for row in rows:
+            self.block(row['account_id'], row['channel_id'], row['until_date'])
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        while self.heap and self.heap[0][0] <= now:
+            until_ts, key = heapq.heappop(self.heap)
+            if self.blocked.get(key) == until_ts: # Skip entries that were re-blocked or replaced
+                del self.blocked[key]
+
+    async def run(self):
+        """Background timer: sleeps until the earliest expiry, or until a sooner one is added"""
+        while True:
+            self.expire()
+            self.changed.clear()
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class Cache:
+    """Runtime cache for the userbot; every channel change swaps in a new Snapshot"""
+
+    def __init__(self):
+        self.snapshot = Snapshot(0, {})
+        self.restrictions = RestrictionIndex()
+        self.entities = {} # {channel_id: title}
+        self.access_hashes = {} # {(account_id, channel_id): access_hash}
+        self.watermark = None # DB time of the last refresh; deltas are fetched from here
+        self.listeners = [] # Called with each new snapshot
+
+    def on_change(self, callback):
+        self.listeners.append(callback)
+
+    def swap(self, snapshot):
+        self.snapshot = snapshot
+        for callback in self.listeners:
+            callback(snapshot)
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    @property
+    def channels_config(self):
+        return self.snapshot.channels_config
+
+    def replace(self, channels_config, watermark=None):
+        """Swaps in a fully reloaded snapshot"""
+        self.swap(Snapshot(self.version + 1, channels_config))
+        if watermark is not None:
+            self.watermark = watermark
+
+    def apply(self, channels=None, removed_channels=(), watermark=None):
+        """Swaps in a snapshot with per-channel changes on top of the current one.
+
+        Returns True if anything actually changed (and the version was bumped).
+        """
+        if watermark is not None:
+            self.watermark = watermark
+
+        current = self.snapshot
+        channels = {ch: c for ch, c in (channels or {}).items() if current.channels_config.get(ch) != c}
+        removed_channels = [ch for ch in removed_channels if ch in current.channels_config]
+        if not (channels or removed_channels):
+            return False
+
+        channels_config = dict(current.channels_config)
+        for ch in removed_channels:
+            del channels_config[ch]
+        channels_config.update(channels)
+        self.swap(Snapshot(current.version + 1, channels_config))
+        return True
+
+
+cache = Cache()
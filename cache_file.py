@@ -0,0 +1,106 @@
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from cache import cache
+
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "cache_snapshot.json") # Warm-start copy of the cache; empty disables it
+CACHE_SNAPSHOT_MAX_AGE = float(os.getenv("CACHE_SNAPSHOT_MAX_AGE", "604800")) # Older files are ignored, seconds
+CACHE_SNAPSHOT_INTERVAL = 10 # Minimum seconds between writes
+FORMAT = 2 # Bumped when the layout changes; other versions are ignored
+
+log = logging.getLogger("cache")
+
+class CacheFile:
+    """The runtime cache on local disk, so a restart can start serving before the DB answers.
+
+    Holds the channel config, restrictions, entity titles and access hashes as
+    compact JSON; accounts always come from the DB. The file is replaced
+    atomically and is readable only by its owner.
+    """
+
+    def __init__(self, path=CACHE_SNAPSHOT_PATH, max_age=CACHE_SNAPSHOT_MAX_AGE, interval=CACHE_SNAPSHOT_INTERVAL):
+        self.path = path
+        self.max_age = max_age
+        self.interval = interval
+        self.dirty = asyncio.Event()
+
+    def changed(self):
+        """Schedules a write; called after each successful refresh from the DB"""
+        self.dirty.set()
+
+    def dump(self):
+        """Builds the file contents from the current cache; the caller holds the loop"""
+        data = {
+            "format": FORMAT,
+            "saved_at": time.time(),
+            "channels": [[ch, comments] for ch, comments in cache.channels_config.items()],
+            "restrictions": [[acc, ch, None if until == math.inf else until] for acc, ch, until in cache.restrictions.entries()],
+            "entities": [[ch, title] for ch, title in cache.entities.items()],
+            "access_hashes": [[acc, ch, access_hash] for (acc, ch), access_hash in cache.access_hashes.items()],
+        }
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def write(self, data):
+        tmp = f"{self.path}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            os.fchmod(f.fileno(), 0o600) # A leftover tmp file keeps its old mode otherwise
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        if not self.path:
+            return
+        self.dirty.clear()
+        await asyncio.to_thread(self.write, self.dump())
+
+    def load(self):
+        """Fills the cache from the file; returns False if there is no usable file"""
+        if not self.path:
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                data = json.loads(f.read())
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            log.warning(f"⚠️ Cache fayli o'qilmadi: {e}")
+            return False
+        age = time.time() - data.get("saved_at", 0)
+        if data.get("format") != FORMAT or age > self.max_age:
+            return False
+
+        cache.replace({ch: [tuple(c) for c in comments] for ch, comments in data["channels"]})
+        cache.restrictions.load([
+            {"account_id": acc, "channel_id": ch,
+             "until_date": datetime.fromtimestamp(until, timezone.utc) if until is not None else None}
+            for acc, ch, until in data["restrictions"]
+        ])
+        cache.entities.update({ch: title for ch, title in data["entities"]})
+        cache.access_hashes.update({(acc, ch): access_hash for acc, ch, access_hash in data["access_hashes"]})
+        log.info(f"💾 Cache fayldan yuklandi ({age:.0f}s oldingi): {len(cache.channels_config)} kanal, "
+                 f"{len(cache.restrictions)} ta cheklov.")
+        return True
+
+    async def run(self):
+        """Writer loop: saves after the cache changed, at most every `interval` seconds"""
+        while True:
+            await self.dirty.wait()
+            try:
+                await self.save()
+            except Exception as e:
+                log.warning(f"⚠️ Cache fayli yozilmadi: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def flush(self):
+        """Writes pending changes; for shutdown"""
+        if self.dirty.is_set():
+            await self.save()
+
+cache_file = CacheFile()
@@ -1,132 +1,577 @@
 import os
+import json
+import time
 import asyncio
+import contextlib
+import logging
 import asyncpg
+import metrics
 from dotenv import load_dotenv
 
 load_dotenv()
 
+log = logging.getLogger("database")
+
 DATABASE_URL = os.getenv("DATABASE_URL")
+CHANGES_CHANNEL = "auto_reply_changes"  # LISTEN/NOTIFY channel for cache invalidation
+
+# Versioned schema migrations, applied in order by Database.init_db and recorded in
+# schema_migrations. Never edit a released migration; append a new one instead.
+# The first ones use IF NOT EXISTS so they also adopt databases created before
+# migrations existed.
+MIGRATIONS = [
+    (1, "baseline tables", '''
+        CREATE TABLE IF NOT EXISTS accounts (
+            id SERIAL PRIMARY KEY,
+            session_string TEXT UNIQUE NOT NULL,
+            name TEXT,
+            phone TEXT,
+            is_active BOOLEAN DEFAULT TRUE,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS channels (
+            id SERIAL PRIMARY KEY,
+            channel_id BIGINT UNIQUE NOT NULL,
+            name TEXT,
+            is_active BOOLEAN DEFAULT TRUE
+        );
+        CREATE TABLE IF NOT EXISTS comments (
+            id SERIAL PRIMARY KEY,
+            channel_id BIGINT REFERENCES channels(channel_id) ON DELETE CASCADE,
+            text TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS restrictions (
+            id SERIAL PRIMARY KEY,
+            session_string TEXT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            until_date TIMESTAMP,
+            UNIQUE(session_string, channel_id)
+        );
+    '''),
+    (2, "channel entities and access hashes", '''
+        CREATE TABLE IF NOT EXISTS channel_entities (
+            channel_id BIGINT PRIMARY KEY,
+            title TEXT,
+            resolved_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE TABLE IF NOT EXISTS access_hashes (
+            account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+            channel_id BIGINT NOT NULL,
+            access_hash BIGINT NOT NULL,
+            PRIMARY KEY (account_id, channel_id)
+        );
+    '''),
+    (3, "updated_at watermarks, channel tombstones and triggers", '''
+        ALTER TABLE channels ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        ALTER TABLE comments ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        ALTER TABLE restrictions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        CREATE INDEX IF NOT EXISTS idx_channels_updated_at ON channels (updated_at);
+        CREATE INDEX IF NOT EXISTS idx_restrictions_updated_at ON restrictions (updated_at);
+
+        -- Deleted channels leave a tombstone so deltas can drop them
+        CREATE TABLE IF NOT EXISTS deleted_channels (
+            channel_id BIGINT PRIMARY KEY,
+            deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = now();
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql;
+
+        -- A comment change marks its channel as changed, so deltas stay per channel
+        CREATE OR REPLACE FUNCTION touch_comment_channel() RETURNS trigger AS $$
+        BEGIN
+            UPDATE channels SET updated_at = now()
+            WHERE channel_id IN (NEW.channel_id, OLD.channel_id);
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION record_deleted_channel() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO deleted_channels (channel_id) VALUES (OLD.channel_id)
+            ON CONFLICT (channel_id) DO UPDATE SET deleted_at = now();
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS channels_touch ON channels;
+        CREATE TRIGGER channels_touch BEFORE UPDATE ON channels
+            FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+        DROP TRIGGER IF EXISTS restrictions_touch ON restrictions;
+        CREATE TRIGGER restrictions_touch BEFORE UPDATE ON restrictions
+            FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+        DROP TRIGGER IF EXISTS comments_touch ON comments;
+        CREATE TRIGGER comments_touch BEFORE UPDATE ON comments
+            FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+        DROP TRIGGER IF EXISTS comments_touch_channel ON comments;
+        CREATE TRIGGER comments_touch_channel AFTER INSERT OR UPDATE OR DELETE ON comments
+            FOR EACH ROW EXECUTE FUNCTION touch_comment_channel();
+        DROP TRIGGER IF EXISTS channels_tombstone ON channels;
+        CREATE TRIGGER channels_tombstone AFTER DELETE ON channels
+            FOR EACH ROW EXECUTE FUNCTION record_deleted_channel();
+    '''),
+    (4, "restriction expiry index", '''
+        CREATE INDEX IF NOT EXISTS idx_restrictions_until_date ON restrictions (until_date);
+    '''),
+    (5, "comments and tombstone indexes, accounts.updated_at", '''
+        CREATE INDEX IF NOT EXISTS idx_comments_channel_id ON comments (channel_id, id);
+        CREATE INDEX IF NOT EXISTS idx_deleted_channels_deleted_at ON deleted_channels (deleted_at);
+        ALTER TABLE accounts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        DROP TRIGGER IF EXISTS accounts_touch ON accounts;
+        CREATE TRIGGER accounts_touch BEFORE UPDATE ON accounts
+            FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+    '''),
+    (6, "restrictions keyed by accounts.id, until_date with time zone", '''
+        ALTER TABLE restrictions ADD COLUMN account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE;
+        UPDATE restrictions r SET account_id = a.id FROM accounts a WHERE a.session_string = r.session_string;
+        DELETE FROM restrictions WHERE account_id IS NULL;
+        ALTER TABLE restrictions ALTER COLUMN account_id SET NOT NULL;
+        ALTER TABLE restrictions DROP COLUMN session_string;
+        ALTER TABLE restrictions ADD CONSTRAINT restrictions_account_channel_key UNIQUE (account_id, channel_id);
+        -- Telegram hands us aware UTC datetimes, which a plain TIMESTAMP column rejects
+        ALTER TABLE restrictions ALTER COLUMN until_date TYPE TIMESTAMPTZ USING until_date AT TIME ZONE 'UTC';
+    '''),
+    (7, "touch a comment's channel once per transaction", '''
+        -- now() is fixed for the transaction, so a bulk import updates the channel row once
+        CREATE OR REPLACE FUNCTION touch_comment_channel() RETURNS trigger AS $$
+        BEGIN
+            UPDATE channels SET updated_at = now()
+            WHERE channel_id IN (NEW.channel_id, OLD.channel_id) AND updated_at <> now();
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+    '''),
+    (8, "comment weights", '''
+        ALTER TABLE comments ADD COLUMN IF NOT EXISTS weight INTEGER NOT NULL DEFAULT 1 CHECK (weight > 0);
+    '''),
+    (9, "comment send history", '''
+        -- Append-only, written in COPY batches; no foreign keys so history outlives its rows
+        CREATE TABLE IF NOT EXISTS comment_log (
+            id BIGSERIAL PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            channel_id BIGINT NOT NULL,
+            post_id BIGINT NOT NULL,
+            comment_id INTEGER,
+            outcome TEXT NOT NULL,
+            posted_at TIMESTAMPTZ,
+            received_at TIMESTAMPTZ,
+            sent_at TIMESTAMPTZ NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_comment_log_sent_at ON comment_log (sent_at);
+    '''),
+]
+
+COMMENT_LOG_COLUMNS = ("account_id", "channel_id", "post_id", "comment_id", "outcome", "posted_at", "received_at", "sent_at")
+
+MIGRATION_LOCK_ID = 7_214_001 # pg_advisory_xact_lock key, serializes concurrent init_db calls
+
+# Pool tuning. The userbot and the admin bot get separate pools so that neither can
+# starve the other when both run under run_all.py.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_ADMIN_POOL_MAX_SIZE = int(os.getenv("DB_ADMIN_POOL_MAX_SIZE", "3"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")) # 0 behind pgbouncer transaction pooling
+DB_MAX_QUERIES = int(os.getenv("DB_MAX_QUERIES", "50000")) # Recycle a connection after this many queries
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300")) # Close idle connections, seconds
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+
+# Every statement the application runs, by name. asyncpg prepares each one once per
+# connection and reuses it from the statement cache, so methods only refer to names.
+QUERIES = {
+    # Accounts
+    "add_account": "INSERT INTO accounts (session_string, name, phone) VALUES ($1, $2, $3) ON CONFLICT (session_string) DO NOTHING",
+    "active_accounts": "SELECT id, session_string, name FROM accounts WHERE is_active = TRUE ORDER BY id",
+    "accounts_page": "SELECT id, name, phone, is_active FROM accounts WHERE id > $1 ORDER BY id LIMIT $2",
+    "accounts_before": "SELECT id FROM accounts WHERE id < $1 ORDER BY id DESC LIMIT $2",
+    "account_count": "SELECT count(*) FROM accounts",
+    "account_is_active": "SELECT is_active FROM accounts WHERE id = $1",
+    "set_account_active": "UPDATE accounts SET is_active = $1 WHERE id = $2",
+    # Channels
+    "add_channel": "INSERT INTO channels (channel_id, name) VALUES ($1, $2) ON CONFLICT (channel_id) DO NOTHING",
+    "delete_channel": "DELETE FROM channels WHERE channel_id = $1",
+    "active_channels": "SELECT channel_id, name FROM channels WHERE is_active = TRUE",
+    "channel": "SELECT channel_id, name FROM channels WHERE channel_id = $1 AND is_active = TRUE",
+    "channels_page": "SELECT id, channel_id, name FROM channels WHERE is_active = TRUE AND id > $1 ORDER BY id LIMIT $2",
+    "channels_before": "SELECT id FROM channels WHERE is_active = TRUE AND id < $1 ORDER BY id DESC LIMIT $2",
+    "channel_count": "SELECT count(*) FROM channels WHERE is_active = TRUE",
+    # Comments
+    "add_comment": "INSERT INTO comments (channel_id, text) VALUES ($1, $2)",
+    "delete_comment": "DELETE FROM comments WHERE id = $1 RETURNING channel_id",
+    "channel_comment_texts": "SELECT text FROM comments WHERE channel_id = $1",
+    "channel_comment_weights": "SELECT text, weight FROM comments WHERE channel_id = $1",
+    "lock_channel": "SELECT 1 FROM channels WHERE channel_id = $1 FOR UPDATE",
+    "set_comment_weight": "UPDATE comments SET weight = $3 WHERE channel_id = $1 AND text = $2",
+    "channel_comments": "SELECT id, text, weight FROM comments WHERE channel_id = $1 ORDER BY id DESC",
+    "comments_first_page": "SELECT id, text, weight FROM comments WHERE channel_id = $1 ORDER BY id DESC LIMIT $2",
+    "comments_page": "SELECT id, text, weight FROM comments WHERE channel_id = $1 AND id < $2 ORDER BY id DESC LIMIT $3",
+    "comments_before": "SELECT id FROM comments WHERE channel_id = $1 AND id > $2 ORDER BY id LIMIT $3",
+    "comment_count": "SELECT count(*) FROM comments WHERE channel_id = $1",
+    "all_config": """
+        SELECT ch.channel_id, array_agg(c.id ORDER BY c.id) AS ids,
+               array_agg(c.text ORDER BY c.id) AS comments, array_agg(c.weight ORDER BY c.id) AS weights
+        FROM channels ch
+        JOIN comments c ON c.channel_id = ch.channel_id
+        WHERE ch.is_active = TRUE
+        GROUP BY ch.channel_id""",
+    # Deltas
+    "now": "SELECT now()",
+    "changed_channels": """
+        SELECT ch.channel_id, ch.is_active,
+               array_remove(array_agg(c.id ORDER BY c.id), NULL) AS ids,
+               array_remove(array_agg(c.text ORDER BY c.id), NULL) AS comments,
+               array_remove(array_agg(c.weight ORDER BY c.id), NULL) AS weights
+        FROM channels ch
+        LEFT JOIN comments c ON c.channel_id = ch.channel_id
+        WHERE ch.updated_at > $1
+        GROUP BY ch.channel_id, ch.is_active""",
+    "deleted_channels": "SELECT channel_id FROM deleted_channels WHERE deleted_at > $1",
+    "changed_restrictions": """
+        SELECT account_id, channel_id, until_date FROM restrictions
+        WHERE updated_at > $1 AND (until_date IS NULL OR until_date > CURRENT_TIMESTAMP)""",
+    # Entities
+    "entity_titles": "SELECT channel_id, title FROM channel_entities",
+    "save_entity_title": """
+        INSERT INTO channel_entities (channel_id, title) VALUES ($1, $2)
+        ON CONFLICT (channel_id) DO UPDATE SET title = EXCLUDED.title, resolved_at = now()""",
+    "access_hashes": """
+        SELECT h.account_id, h.channel_id, h.access_hash FROM access_hashes h
+        JOIN accounts a ON a.id = h.account_id WHERE a.is_active = TRUE""",
+    "save_access_hash": """
+        INSERT INTO access_hashes (account_id, channel_id, access_hash) VALUES ($1, $2, $3)
+        ON CONFLICT (account_id, channel_id) DO UPDATE SET access_hash = EXCLUDED.access_hash""",
+    # Restrictions
+    "add_restriction": """
+        INSERT INTO restrictions (account_id, channel_id, until_date) VALUES ($1, $2, $3)
+        ON CONFLICT (account_id, channel_id) DO UPDATE SET until_date = EXCLUDED.until_date""",
+    "active_restrictions": "SELECT account_id, channel_id, until_date FROM restrictions WHERE until_date IS NULL OR until_date > CURRENT_TIMESTAMP",
+    "delete_expired_restrictions": "DELETE FROM restrictions WHERE until_date <= CURRENT_TIMESTAMP",
+    # Send history
+    "prune_comment_log": "DELETE FROM comment_log WHERE sent_at < now() - $1::interval",
+    "history_outcomes": """
+        SELECT outcome, count(*) AS sends FROM comment_log
+        WHERE sent_at > now() - $1::interval GROUP BY outcome ORDER BY sends DESC""",
+    "history_channels": """
+        SELECT l.channel_id, ch.name, count(*) AS sends,
+               count(*) FILTER (WHERE l.outcome = 'ok') AS ok,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY extract(epoch FROM l.sent_at - l.posted_at))
+                   FILTER (WHERE l.outcome = 'ok') AS p50,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY extract(epoch FROM l.sent_at - l.posted_at))
+                   FILTER (WHERE l.outcome = 'ok') AS p95
+        FROM comment_log l LEFT JOIN channels ch ON ch.channel_id = l.channel_id
+        WHERE l.sent_at > now() - $1::interval
+        GROUP BY l.channel_id, ch.name ORDER BY sends DESC LIMIT $2""",
+    "history_accounts": """
+        SELECT l.account_id, a.name, count(*) AS sends,
+               count(*) FILTER (WHERE l.outcome = 'ok') AS ok
+        FROM comment_log l LEFT JOIN accounts a ON a.id = l.account_id
+        WHERE l.sent_at > now() - $1::interval
+        GROUP BY l.account_id, a.name ORDER BY sends DESC LIMIT $2""",
+    # Change notifications
+    "notify": "SELECT pg_notify($1, $2)",
+    "ping": "SELECT 1",
+}
 
 class Database:
-    def __init__(self):
+    def __init__(self, name="userbot", min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE):
+        self.name = name # Label for the pool metrics
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
         self.pool = None
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self, dsn=None):
+        async with self._connect_lock:
+            if not self.pool:
+                self.pool = await asyncpg.create_pool(
+                    dsn or DATABASE_URL,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    max_queries=DB_MAX_QUERIES,
+                    max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+                    command_timeout=DB_COMMAND_TIMEOUT,
+                )
+                try:
+                    await self.init_db()
+                except Exception:
+                    # The next connect() starts over and runs the migrations again
+                    self.pool.terminate()
+                    self.pool = None
+                    raise
 
-    async def connect(self):
+    async def close(self, timeout=10):
+        """Closes the pool once its connections are released; terminates them after `timeout`"""
         if not self.pool:
-            self.pool = await asyncpg.create_pool(DATABASE_URL)
-            await self.init_db()
+            return
+        try:
+            await asyncio.wait_for(self.pool.close(), timeout)
+        except asyncio.TimeoutError:
+            self.pool.terminate()
+        self.pool = None
 
-    async def init_db(self):
+    def pool_stats(self):
+        if not self.pool:
+            return {"size": 0, "idle": 0, "max": self.max_size}
+        return {"size": self.pool.get_size(), "idle": self.pool.get_idle_size(), "max": self.max_size}
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        """pool.acquire() that records how long we waited for a connection"""
+        start = time.perf_counter()
         async with self.pool.acquire() as conn:
-            # Accounts table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS accounts (
-                    id SERIAL PRIMARY KEY,
-                    session_string TEXT UNIQUE NOT NULL,
-                    name TEXT,
-                    phone TEXT,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            # Channels table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS channels (
-                    id SERIAL PRIMARY KEY,
-                    channel_id BIGINT UNIQUE NOT NULL,
-                    name TEXT,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            ''')
-            # Comments table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS comments (
-                    id SERIAL PRIMARY KEY,
-                    channel_id BIGINT REFERENCES channels(channel_id) ON DELETE CASCADE,
-                    text TEXT NOT NULL
-                )
-            ''')
-            # Restrictions table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS restrictions (
-                    id SERIAL PRIMARY KEY,
-                    session_string TEXT NOT NULL,
-                    channel_id BIGINT NOT NULL,
-                    until_date TIMESTAMP,
-                    UNIQUE(session_string, channel_id)
-                )
-            ''')
+            metrics.db_pool_acquire_seconds.observe(time.perf_counter() - start, pool=self.name)
+            yield conn
+
+    async def fetch(self, query, *args):
+        async with self.acquire() as conn:
+            return await conn.fetch(QUERIES[query], *args)
+
+    async def fetchrow(self, query, *args):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(QUERIES[query], *args)
+
+    async def fetchval(self, query, *args):
+        async with self.acquire() as conn:
+            return await conn.fetchval(QUERIES[query], *args)
+
+    async def execute(self, query, *args):
+        async with self.acquire() as conn:
+            return await conn.execute(QUERIES[query], *args)
+
+    async def init_db(self):
+        """Applies pending MIGRATIONS in one transaction; safe to call from several processes"""
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_ID)
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    )
+                ''')
+                applied = {row['version'] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+                for version, name, sql in MIGRATIONS:
+                    if version in applied:
+                        continue
+                    await conn.execute(sql)
+                    await conn.execute("INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name)
+                    log.info(f"🗄 Migratsiya {version} qo'llanildi: {name}")
+
+    async def notify_change(self, conn, table, **keys):
+        """Tells listening userbots which rows changed, e.g. {"table": "comments", "channel_id": ...}"""
+        await conn.execute(QUERIES["notify"], CHANGES_CHANNEL, json.dumps({"table": table, **keys}))
+
+    async def listen_changes(self, callback, heartbeat=30):
+        """Holds a connection that LISTENs for change notifications until it breaks"""
+        async with self.acquire() as conn:
+            def on_notify(connection, pid, channel, payload):
+                callback(json.loads(payload))
+
+            await conn.add_listener(CHANGES_CHANNEL, on_notify)
+            try:
+                while True:
+                    await asyncio.sleep(heartbeat)
+                    await conn.execute(QUERIES["ping"])  # Raises once the connection is gone
+            finally:
+                if not conn.is_closed():
+                    await conn.remove_listener(CHANGES_CHANNEL, on_notify)
 
     # Account operations
     async def add_account(self, session_string, name=None, phone=None):
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO accounts (session_string, name, phone) VALUES ($1, $2, $3) ON CONFLICT (session_string) DO NOTHING",
-                session_string, name, phone
-            )
+        await self.execute("add_account", session_string, name, phone)
 
     async def get_active_accounts(self):
-        async with self.pool.acquire() as conn:
-            return await conn.fetch("SELECT session_string, name FROM accounts WHERE is_active = TRUE")
+        return await self.fetch("active_accounts")
+
+    # Admin lists are keyset-paginated: a page is the rows after a cursor (the last key
+    # of the previous page), and *_before finds the cursor of the page preceding `first`.
+    async def get_accounts_page(self, after, limit):
+        return await self.fetch("accounts_page", after, limit)
+
+    async def get_accounts_cursor_before(self, first, page_size):
+        rows = await self.fetch("accounts_before", first, page_size + 1)
+        return rows[page_size]['id'] if len(rows) > page_size else 0
+
+    async def count_accounts(self):
+        return await self.fetchval("account_count")
+
+    async def is_account_active(self, account_id):
+        return await self.fetchval("account_is_active", account_id)
 
     async def toggle_account(self, account_id, status: bool):
-        async with self.pool.acquire() as conn:
-            await conn.execute("UPDATE accounts SET is_active = $1 WHERE id = $2", status, account_id)
+        async with self.acquire() as conn:
+            await conn.execute(QUERIES["set_account_active"], status, account_id)
+            await self.notify_change(conn, "accounts", id=account_id)
 
     # Channel operations
     async def add_channel(self, channel_id, name=None):
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO channels (channel_id, name) VALUES ($1, $2) ON CONFLICT (channel_id) DO NOTHING",
-                channel_id, name
-            )
+        async with self.acquire() as conn:
+            await conn.execute(QUERIES["add_channel"], channel_id, name)
+            await self.notify_change(conn, "channels", channel_id=channel_id)
+
+    async def delete_channel(self, channel_id):
+        async with self.acquire() as conn:
+            await conn.execute(QUERIES["delete_channel"], channel_id)
+            await self.notify_change(conn, "channels", channel_id=channel_id)
 
     async def get_active_channels(self):
-        async with self.pool.acquire() as conn:
-            return await conn.fetch("SELECT channel_id, name FROM channels WHERE is_active = TRUE")
+        return await self.fetch("active_channels")
+
+    async def get_channel(self, channel_id):
+        return await self.fetchrow("channel", channel_id)
+
+    async def get_channels_page(self, after, limit):
+        return await self.fetch("channels_page", after, limit)
+
+    async def get_channels_cursor_before(self, first, page_size):
+        rows = await self.fetch("channels_before", first, page_size + 1)
+        return rows[page_size]['id'] if len(rows) > page_size else 0
+
+    async def count_channels(self):
+        return await self.fetchval("channel_count")
 
     # Comment operations
     async def add_comment(self, channel_id, text):
-        async with self.pool.acquire() as conn:
-            await conn.execute("INSERT INTO comments (channel_id, text) VALUES ($1, $2)", channel_id, text)
+        async with self.acquire() as conn:
+            await conn.execute(QUERIES["add_comment"], channel_id, text)
+            await self.notify_change(conn, "comments", channel_id=channel_id)
+
+    async def delete_comment(self, comment_id):
+        async with self.acquire() as conn:
+            channel_id = await conn.fetchval(QUERIES["delete_comment"], comment_id)
+            if channel_id is not None:
+                await self.notify_change(conn, "comments", channel_id=channel_id)
+
+    async def import_comments(self, channel_id, comments):
+        """Adds {text: weight} entries the channel doesn't have yet in one COPY and updates
+        the weight of existing ones; returns (added, reweighted)"""
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                # Serializes concurrent imports into the same channel so the dedupe holds
+                await conn.execute(QUERIES["lock_channel"], channel_id)
+                existing = {row['text']: row['weight'] for row in await conn.fetch(QUERIES["channel_comment_weights"], channel_id)}
+                new = [(channel_id, text, weight) for text, weight in comments.items() if text not in existing]
+                reweighted = [(channel_id, text, weight) for text, weight in comments.items()
+                              if text in existing and existing[text] != weight]
+                if new:
+                    await conn.copy_records_to_table("comments", records=new, columns=("channel_id", "text", "weight"))
+                if reweighted:
+                    await conn.executemany(QUERIES["set_comment_weight"], reweighted)
+                if new or reweighted:
+                    await self.notify_change(conn, "comments", channel_id=channel_id)
+        return len(new), len(reweighted)
 
     async def get_comments_for_channel(self, channel_id):
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT text FROM comments WHERE channel_id = $1", channel_id)
-            return [row['text'] for row in rows]
+        rows = await self.fetch("channel_comment_texts", channel_id)
+        return [row['text'] for row in rows]
+
+    async def get_channel_comments(self, channel_id):
+        """(id, text, weight) rows, newest first"""
+        return await self.fetch("channel_comments", channel_id)
+
+    async def get_comments_page(self, channel_id, before, limit):
+        """Newest first; before=0 starts at the newest comment"""
+        if not before:
+            return await self.fetch("comments_first_page", channel_id, limit)
+        return await self.fetch("comments_page", channel_id, before, limit)
+
+    async def get_comments_cursor_before(self, channel_id, first, page_size):
+        rows = await self.fetch("comments_before", channel_id, first, page_size + 1)
+        return rows[page_size]['id'] if len(rows) > page_size else 0
+
+    async def count_comments(self, channel_id):
+        return await self.fetchval("comment_count", channel_id)
 
     async def get_all_config(self):
-        """Fetches all channels and their comments for in-memory caching"""
-        async with self.pool.acquire() as conn:
-            channels = await conn.fetch("SELECT channel_id FROM channels WHERE is_active = TRUE")
-            config = {}
-            for ch in channels:
-                channel_id = ch['channel_id']
-                comments = await self.get_comments_for_channel(channel_id)
-                if comments:
-                    config[channel_id] = comments
-            return config
+        """Fetches all channels and their comments for in-memory caching in a single query"""
+        rows = await self.fetch("all_config")
+        return {row['channel_id']: list(zip(row['ids'], row['comments'], row['weights'])) for row in rows}
 
-    # Restriction operations
-    async def add_restriction(self, session_string, channel_id, until_date=None):
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                """INSERT INTO restrictions (session_string, channel_id, until_date) VALUES ($1, $2, $3)
-                   ON CONFLICT (session_string, channel_id) DO UPDATE SET until_date = EXCLUDED.until_date""",
-                session_string, channel_id, until_date
-            )
+    async def get_changes_since(self, since):
+        """Returns (now, changed, removed, restrictions) for rows touched after the `since` watermark.
 
-    async def is_restricted(self, session_string, channel_id):
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                """SELECT until_date FROM restrictions 
-                   WHERE session_string = $1 AND channel_id = $2 AND (until_date IS NULL OR until_date > CURRENT_TIMESTAMP)""",
-                session_string, channel_id
+        `changed` maps channel_id to its full [(id, text, weight)] list; `removed` holds channels that
+        were deleted, deactivated or left without comments; `restrictions` are the
+        still-active restriction rows that were added or updated.
+        """
+        async with self.acquire() as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                now = await conn.fetchval(QUERIES["now"])
+                rows = await conn.fetch(QUERIES["changed_channels"], since)
+                deleted = await conn.fetch(QUERIES["deleted_channels"], since)
+                restrictions = await conn.fetch(QUERIES["changed_restrictions"], since)
+
+        changed, removed = {}, set()
+        for row in rows:
+            if row['is_active'] and row['comments']:
+                changed[row['channel_id']] = list(zip(row['ids'], row['comments'], row['weights']))
+            else:
+                removed.add(row['channel_id'])
+        # A channel that was deleted and then re-added shows up in `rows`, which wins
+        removed.update(r['channel_id'] for r in deleted if r['channel_id'] not in changed)
+        return now, changed, removed, restrictions
+
+    # Entity operations
+    async def get_entity_titles(self):
+        rows = await self.fetch("entity_titles")
+        return {row['channel_id']: row['title'] for row in rows}
+
+    async def save_entity_titles(self, titles):
+        """Upserts {channel_id: title}"""
+        async with self.acquire() as conn:
+            await conn.executemany(QUERIES["save_entity_title"], list(titles.items()))
+
+    async def get_access_hashes(self):
+        rows = await self.fetch("access_hashes")
+        return {(row['account_id'], row['channel_id']): row['access_hash'] for row in rows}
+
+    async def save_access_hashes(self, hashes):
+        """Upserts {(account_id, channel_id): access_hash}"""
+        async with self.acquire() as conn:
+            await conn.executemany(
+                QUERIES["save_access_hash"],
+                [(acc_id, ch_id, h) for (acc_id, ch_id), h in hashes.items()]
             )
-            return row is not None
+
+    # Restriction operations
+    async def add_restriction(self, account_id, channel_id, until_date=None):
+        async with self.acquire() as conn:
+            await conn.execute(QUERIES["add_restriction"], account_id, channel_id, until_date)
+            await self.notify_change(conn, "restrictions", channel_id=channel_id)
 
     async def get_all_restrictions(self):
-        async with self.pool.acquire() as conn:
-            return await conn.fetch("SELECT session_string, channel_id, until_date FROM restrictions WHERE until_date IS NULL OR until_date > CURRENT_TIMESTAMP")
+        return await self.fetch("active_restrictions")
+
+    async def delete_expired_restrictions(self):
+        """Cleanup job; returns the number of rows removed"""
+        result = await self.execute("delete_expired_restrictions")
+        return int(result.split()[-1])
+
+    # Send history
+    async def write_comment_log(self, rows):
+        """COPYs (account_id, channel_id, post_id, comment_id, outcome, posted_at, received_at, sent_at) rows"""
+        async with self.acquire() as conn:
+            await conn.copy_records_to_table("comment_log", records=rows, columns=COMMENT_LOG_COLUMNS)
+
+    async def prune_comment_log(self, older_than):
+        result = await self.execute("prune_comment_log", older_than)
+        return int(result.split()[-1])
+
+    async def get_history_summary(self, period, limit=10):
+        """(outcome counts, busiest channels, busiest accounts) over the last `period`"""
+        async with self.acquire() as conn:
+            outcomes = await conn.fetch(QUERIES["history_outcomes"], period)
+            channels = await conn.fetch(QUERIES["history_channels"], period, limit)
+            accounts = await conn.fetch(QUERIES["history_accounts"], period, limit)
+        return outcomes, channels, accounts
+
+    async def get_now(self):
+        return await self.fetchval("now")
+
+db = Database("userbot")
+admin_db = Database("admin", max_size=DB_ADMIN_POOL_MAX_SIZE)
 
-db = Database()
+metrics.registry.gauge(
+    "autoreply_db_pool_connections", "Pool connections by pool and state", ("pool", "state"),
+    callback=lambda: {(d.name, state): n for d in (db, admin_db) for state, n in d.pool_stats().items()})
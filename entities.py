@@ -0,0 +1,105 @@
+import os
+import time
+import asyncio
+import logging
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, PeerChannel
+from database import db
+from cache import cache
+
+ENTITY_REFRESH_INTERVAL = int(os.getenv("ENTITY_REFRESH_INTERVAL", "21600")) # Title refresh, seconds
+ENTITY_RETRY_BACKOFF = (300, ENTITY_REFRESH_INTERVAL) # First and longest wait before retrying a channel no account could resolve, seconds
+
+log = logging.getLogger("entities")
+
+async def load_entities():
+    """Loads persisted titles and access hashes into the cache: two queries, no Telegram calls"""
+    cache.entities.update(await db.get_entity_titles())
+    cache.access_hashes.update(await db.get_access_hashes())
+
+def input_peer(account, channel_id):
+    """Returns an InputPeerChannel when this account's access hash is known, else the bare id"""
+    access_hash = cache.access_hashes.get((account.id, channel_id))
+    if access_hash is None:
+        return channel_id
+    real_id, peer_type = utils.resolve_id(channel_id)
+    if peer_type is not PeerChannel:
+        return channel_id
+    return InputPeerChannel(real_id, access_hash)
+
+class EntityResolver:
+    """Resolves missing channel titles in the background, once for all accounts, and persists them"""
+
+    def __init__(self, get_accounts):
+        self.get_accounts = get_accounts # Returns the currently connected Account objects
+        self.wanted = set() # channel ids waiting for a title
+        self.failed = {} # {channel_id: (retry_at, delay)} for channels no account could resolve
+        self.new_hashes = {} # access hashes not yet written to the DB
+        self.ready = asyncio.Event()
+
+    def request(self, channel_id):
+        if channel_id in self.wanted:
+            return
+        failed = self.failed.get(channel_id)
+        if failed and failed[0] > time.monotonic():
+            return # Every account failed on it recently; don't repeat those RPCs on each send
+        self.wanted.add(channel_id)
+        self.ready.set()
+
+    def on_snapshot(self, snapshot):
+        """Cache listener: queues newly configured channels that have no title yet"""
+        for channel_id in snapshot.channels_config:
+            if channel_id not in cache.entities:
+                self.request(channel_id)
+
+    def remember(self, account, channel_id, peer):
+        """Records an access hash a client already holds, e.g. after a successful send"""
+        access_hash = getattr(peer, "access_hash", None)
+        key = (account.id, channel_id)
+        if access_hash is not None and cache.access_hashes.get(key) != access_hash:
+            cache.access_hashes[key] = access_hash
+            self.new_hashes[key] = access_hash
+            self.ready.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.ready.wait(), ENTITY_REFRESH_INTERVAL)
+            except asyncio.TimeoutError:
+                # Periodic refresh, channel titles can change
+                for channel_id in cache.channels_config:
+                    self.request(channel_id)
+            self.ready.clear()
+            try:
+                await self.resolve_pending()
+            except Exception as e:
+                log.warning(f"⚠️ Kanal nomlari aniqlanmadi: {e}")
+
+    async def resolve_pending(self):
+        accounts = list(self.get_accounts())
+        if not accounts:
+            return # Kept in `wanted` until an account is connected
+        wanted, self.wanted = self.wanted, set()
+        titles = {}
+        for channel_id in wanted:
+            # Any one account that can see the channel is enough
+            for account in accounts:
+                try:
+                    entity = await account.client.get_entity(channel_id)
+                except Exception:
+                    continue
+                titles[channel_id] = entity.title
+                self.remember(account, channel_id, entity)
+                self.failed.pop(channel_id, None)
+                break
+            else:
+                _, delay = self.failed.get(channel_id, (0, ENTITY_RETRY_BACKOFF[0] / 2))
+                delay = min(delay * 2, ENTITY_RETRY_BACKOFF[1])
+                self.failed[channel_id] = (time.monotonic() + delay, delay)
+
+        if titles:
+            cache.entities.update(titles)
+            await db.save_entity_titles(titles)
+        if self.new_hashes:
+            hashes, self.new_hashes = self.new_hashes, {}
+            await db.save_access_hashes(hashes)
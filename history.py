@@ -0,0 +1,95 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from database import db
+
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "5")) # Seconds between comment_log writes
+HISTORY_BATCH_SIZE = 500 # Rows that trigger an early flush
+HISTORY_MAX_BUFFER = 50000 # Rows held while the DB is unreachable; the oldest are dropped beyond this
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "30")) # comment_log rows older than this are pruned
+HISTORY_PRUNE_INTERVAL = int(os.getenv("HISTORY_PRUNE_INTERVAL", "3600")) # Seconds between retention passes
+
+log = logging.getLogger("history")
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc) if seconds is not None else None
+
+class SendHistory:
+    """In-memory buffer of comment_log rows, written in COPY batches by a single writer.
+
+    record() only appends a tuple, so the send path never waits on the DB. run()
+    flushes every `flush_interval` seconds or as soon as `batch_size` rows are
+    buffered; rows from a failed write go back to the front of the buffer.
+    """
+
+    def __init__(self, flush_interval=HISTORY_FLUSH_INTERVAL, batch_size=HISTORY_BATCH_SIZE, max_buffer=HISTORY_MAX_BUFFER):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.rows = [] # (account_id, channel_id, post_id, comment_id, outcome, posted_at, received_at, sent_at), epoch seconds
+        self.full = asyncio.Event()
+        self.written = 0 # Rows committed to comment_log
+        self.dropped = 0 # Rows lost to the buffer limit
+
+    def record(self, account_id, channel_id, post_id, comment_id, outcome, posted_at, received_at, sent_at):
+        self.rows.append((account_id, channel_id, post_id, comment_id, outcome, posted_at, received_at, sent_at))
+        if len(self.rows) > self.max_buffer:
+            del self.rows[0]
+            self.dropped += 1
+        if len(self.rows) >= self.batch_size:
+            self.full.set()
+
+    def stats(self):
+        return {"buffered": len(self.rows), "written": self.written, "dropped": self.dropped}
+
+    async def flush(self):
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        self.full.clear()
+        records = [(*row[:5], _timestamp(row[5]), _timestamp(row[6]), _timestamp(row[7])) for row in rows]
+        try:
+            await db.write_comment_log(records)
+        except Exception:
+            # Keep them for the next attempt, still within the buffer limit
+            self.rows[:0] = rows
+            overflow = len(self.rows) - self.max_buffer
+            if overflow > 0:
+                del self.rows[:overflow]
+                self.dropped += overflow
+            raise
+        self.written += len(rows)
+
+    async def run(self):
+        """Writer loop; run exactly one per SendHistory"""
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                log.warning(f"⚠️ Yuborish tarixi yozilmadi ({len(self.rows)} ta qator kutmoqda): {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    async def drain(self):
+        """Writes whatever is buffered; for shutdown, after the send queues are drained"""
+        await self.flush()
+
+    async def prune(self, days=HISTORY_RETENTION_DAYS):
+        return await db.prune_comment_log(timedelta(days=days))
+
+    async def prune_loop(self, interval=HISTORY_PRUNE_INTERVAL):
+        """Deletes comment_log rows past HISTORY_RETENTION_DAYS every `interval` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                pruned = await self.prune()
+                if pruned:
+                    log.info(f"🧹 {pruned} ta eski yuborish tarixi yozuvi o'chirildi.")
+            except Exception as e:
+                log.warning(f"⚠️ Yuborish tarixi tozalanmadi: {e}")
+
+history = SendHistory()
@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO") # Level for every logger without an override
+LOG_LEVELS = os.getenv("LOG_LEVELS", "") # Per-logger overrides, e.g. "userbot.send=WARNING,aiogram=WARNING"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1")) # Fraction of successful-send lines kept
+LOG_QUEUE_SIZE = 10000 # Records waiting for the writer thread; new ones are dropped beyond this
+SAMPLED_LOGGERS = ("userbot.send",) # High-volume success lines; warnings and errors are never sampled
+
+def fields(**values):
+    """`extra` for structured fields: log.info("...", extra=fields(account=name, outcome="ok"))"""
+    return {"fields": values}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg and the record's fields"""
+
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name, "msg": record.getMessage()}
+        entry.update(getattr(record, "fields", None) or {})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class Sampler(logging.Filter):
+    """Keeps `rate` of the records below WARNING"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; never blocks the event loop, drops when the queue is full"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+
+def setup(level=LOG_LEVEL, levels=LOG_LEVELS, sample_rate=LOG_SAMPLE_RATE):
+    """Routes every logger through a bounded queue to a thread writing JSON lines to stdout.
+
+    Call once per process, before the event loop starts; the queue is flushed at exit.
+    """
+    global _listener
+    if _listener:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    q = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(q)
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+    for item in levels.split(","):
+        name, _, name_level = item.partition("=")
+        if name.strip() and name_level.strip():
+            logging.getLogger(name.strip()).setLevel(name_level.strip().upper())
+    for name in SAMPLED_LOGGERS:
+        logging.getLogger(name).addFilter(Sampler(sample_rate))
+
+    _listener = QueueListener(q, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+    metrics.registry.gauge("autoreply_log_records_dropped", "Log records dropped because the log queue was full",
+                           callback=lambda: handler.dropped)
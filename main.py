@@ -1,8 +1,13 @@
 import os
+import time
 import asyncio
+import functools
+import contextlib
 import aiohttp
 import random
-from datetime import datetime
+import logging
+from collections import OrderedDict
+from datetime import timedelta
 from dotenv import load_dotenv
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
@@ -13,66 +18,468 @@ from telethon.errors import (
     ChannelPrivateError, ChatWriteForbiddenError, PeerIdInvalidError
 )
 from database import db
+from cache import cache
+from admin_log import AdminLog
+from entities import EntityResolver, load_entities, input_peer
+import metrics
+from tracing import Trace
+from selection import CommentPicker
+from supervisor import supervisor
+from history import history
+from cache_file import cache_file
+import logs
 
 load_dotenv()
 
+log = logging.getLogger("userbot")
+send_log = logging.getLogger("userbot.send") # One line per comment attempt
+
 API_ID = int(os.getenv("API_ID"))
 API_HASH = os.getenv("API_HASH")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID") # Admin for logging
+CACHE_REFRESH_INTERVAL = int(os.getenv("CACHE_REFRESH_INTERVAL", "60")) # Watermark delta refresh, seconds
+CACHE_RESYNC_INTERVAL = int(os.getenv("CACHE_RESYNC_INTERVAL", "900")) # Safety-net full reload, seconds
+POST_DEDUP_WINDOW = float(os.getenv("POST_DEDUP_WINDOW", "120")) # Seconds a post or album is remembered for de-duplication
+RESTRICTION_CLEANUP_INTERVAL = int(os.getenv("RESTRICTION_CLEANUP_INTERVAL", "3600")) # Expired rows purge, seconds
+STARTUP_CONCURRENCY = int(os.getenv("STARTUP_CONCURRENCY", "10")) # Accounts logging in at the same time
+STARTUP_STAGGER = float(os.getenv("STARTUP_STAGGER", "0.2")) # Seconds between account launches
+TURN_DELAY = float(os.getenv("TURN_DELAY", "0.5")) # Extra delay per position in a post's queue, seconds
+TURN_JITTER = (0.1, 0.4) # Random human-like delay added to every position but the first
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "50")) # Posts waiting per account before the oldest is dropped
+SEND_MAX_AGE = float(os.getenv("SEND_MAX_AGE", "300")) # Posts received longer ago than this are skipped, seconds
+FLOODWAIT_MARGIN = 2 # Seconds added on top of the server's FloodWait
 
-# Global Cache
-class Cache:
-    channels_config = {} # {channel_id: [comments]}
-    entities = {} # {channel_id: title}
-    restrictions = {} # {(session_str, channel_id): until_date}
+admin_log = AdminLog(BOT_TOKEN, CHAT_ID)
 
-cache = Cache()
+# Re-read a short window behind the watermark so slow in-flight transactions aren't missed
+WATERMARK_OVERLAP = timedelta(seconds=10)
 
 async def update_cache():
-    """Updates the in-memory cache from the database"""
-    cache.channels_config = await db.get_all_config()
-    
-    # Load restrictions
+    """Reloads the whole in-memory cache from the database"""
+    start = time.perf_counter()
+    watermark = await db.get_now()
+    channels_config = await db.get_all_config()
     restrs = await db.get_all_restrictions()
-    cache.restrictions = {(r['session_string'], r['channel_id']): r['until_date'] for r in restrs}
-    
-    print(f"🔄 Cache yangilandi: {len(cache.channels_config)} kanal, {len(cache.restrictions)} ta cheklov yuklandi.")
+    cache.replace(channels_config, watermark)
+    cache.restrictions.load(restrs)
+    cache_file.changed()
+    metrics.cache_refresh_seconds.observe(time.perf_counter() - start, kind="full")
+
+    log.info(f"🔄 Cache yangilandi: {len(cache.channels_config)} kanal, {len(cache.restrictions)} ta cheklov yuklandi (v{cache.version}).")
+
+async def refresh_cache():
+    """Applies only the rows changed since the last watermark"""
+    if cache.watermark is None:
+        await update_cache()
+        return
+    start = time.perf_counter()
+    now, changed, removed, restrs = await db.get_changes_since(cache.watermark - WATERMARK_OVERLAP)
+    if cache.apply(channels=changed, removed_channels=removed, watermark=now) or restrs:
+        cache_file.changed()
+    cache.restrictions.update(restrs)
+    metrics.cache_refresh_seconds.observe(time.perf_counter() - start, kind="delta")
+
+# Set by change notifications, consumed by apply_changes_loop so bursts coalesce into one refresh
+changes_ready = asyncio.Event()
+
+def on_db_change(change):
+    """Called by the database listener for every NOTIFY payload"""
+    if change.get("table") == "accounts":
+        # The account set is fixed for the life of the process
+        log.info(f"ℹ️ Akkaunt #{change.get('id')} holati o'zgardi, qayta ishga tushirilganda qo'llaniladi.")
+        return
+    changes_ready.set()
+
+async def apply_changes_loop():
+    while True:
+        await changes_ready.wait()
+        changes_ready.clear()
+        try:
+            await refresh_cache()
+        except Exception as e:
+            log.warning(f"⚠️ Cache o'zgarishlari qo'llanilmadi: {e}")
 
-async def send_to_admin(session, text: str):
-    """Sends logs to the admin bot without blocking"""
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    data = {"chat_id": CHAT_ID, "text": text}
+async def safe_update_cache():
     try:
-        async with session.post(url, data=data) as resp:
-            if resp.status != 200:
-                print(f"⚠️ Admin logda xato: {resp.status}")
+        await update_cache()
     except Exception as e:
-        print(f"⚠️ Admin log yuborilmadi: {e}")
+        log.warning(f"⚠️ Cache yangilanmadi: {e}")
+
+class TurnOrder:
+    """Each account's position in a post's comment queue, computed once per post and shared by all clients"""
+
+    def __init__(self, max_posts=1024):
+        self.max_posts = max_posts
+        self.positions = OrderedDict() # {(chat_id, post_id): [position of account 0, 1, ...]}
+
+    def position(self, chat_id, post_id, account_index, total_accounts):
+        key = (chat_id, post_id)
+        positions = self.positions.get(key)
+        if positions is None or len(positions) != total_accounts:
+            # Seeded by message id only, so every process derives the same order for a post
+            rng = random.Random(post_id)
+            order = list(range(total_accounts))
+            rng.shuffle(order)
+            positions = [0] * total_accounts
+            for pos, idx in enumerate(order):
+                positions[idx] = pos
+            self.positions[key] = positions
+            if len(self.positions) > self.max_posts:
+                self.positions.popitem(last=False)
+        return positions[account_index]
+
+turn_order = TurnOrder()
+
+class Post:
+    """A dispatched post: its canonical id, when it first arrived and the accounts it was queued for"""
+    __slots__ = ("post_id", "received_at", "expires_at", "accounts")
+
+    def __init__(self, post_id, received_at, expires_at):
+        self.post_id = post_id
+        self.received_at = received_at
+        self.expires_at = expires_at
+        self.accounts = set() # account indexes whose client delivered the post
+
+class RecentPosts:
+    """Posts dispatched in the last `window` seconds, so each is queued once per account.
+
+    A media album arrives as several messages sharing a grouped_id. Albums are keyed
+    by (chat_id, grouped_id) and other posts by (chat_id, message id); the first
+    message seen (Telegram sends an album in id order, so its lowest id) is the
+    post's canonical id. Entries expire after `window` seconds, and at most
+    `max_size` are kept.
+    """
+
+    def __init__(self, window=POST_DEDUP_WINDOW, max_size=4096):
+        self.window = window
+        self.max_size = max_size
+        self.posts = OrderedDict() # {key: Post}, oldest first
+
+    def claim(self, chat_id, message_id, grouped_id, account_index):
+        """The message's Post if it is the first copy delivered to this account, else None"""
+        now = time.monotonic()
+        while self.posts:
+            key, post = next(iter(self.posts.items()))
+            if post.expires_at > now:
+                break
+            del self.posts[key]
+        key = (chat_id, "album", grouped_id) if grouped_id else (chat_id, message_id)
+        post = self.posts.get(key)
+        if post is None:
+            post = self.posts[key] = Post(message_id, time.time(), now + self.window)
+            if len(self.posts) > self.max_size:
+                self.posts.popitem(last=False)
+        elif account_index in post.accounts:
+            metrics.posts_deduplicated_total.inc(kind="album" if grouped_id else "repeat")
+            return None
+        post.accounts.add(account_index)
+        return post
+
+class Account:
+    """A connected userbot account that can send comments"""
+    __slots__ = ("id", "index", "client", "name", "session_str", "queue")
+
+    def __init__(self, id, index, client, name, session_str):
+        self.id = id # accounts.id
+        self.index = index
+        self.client = client
+        self.name = name
+        self.session_str = session_str
+        self.queue = SendQueue(self)
+
+class SendJob:
+    """One post this account should comment on, not before `due`"""
+    __slots__ = ("channel_id", "post_id", "comments", "trace", "received_at", "due")
+
+    def __init__(self, channel_id, post_id, comments, trace, received_at, due):
+        self.channel_id = channel_id
+        self.post_id = post_id
+        self.comments = comments
+        self.trace = trace
+        self.received_at = received_at
+        self.due = due
+
+class SendQueue:
+    """Bounded per-account queue of posts, drained by a single worker.
+
+    A full queue drops its oldest post ("overflow") and a post received more than
+    SEND_MAX_AGE ago when its turn comes is skipped ("stale"). A FloodWait pauses
+    the worker, so the whole account waits it out instead of piling up sends.
+    """
+
+    def __init__(self, account, maxsize=SEND_QUEUE_SIZE, max_age=SEND_MAX_AGE):
+        self.account = account
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.jobs = OrderedDict() # {(channel_id, post_id): SendJob}, oldest first
+        self.wakeup = asyncio.Event()
+        self.paused_until = 0.0 # time.time() until which a FloodWait holds the account
+        self.sending = False
+        self.dropped = {} # {reason: count}
+
+    def __len__(self):
+        return len(self.jobs) + self.sending
+
+    def put(self, job):
+        if len(self.jobs) >= self.maxsize:
+            self.jobs.popitem(last=False)
+            self.drop("overflow")
+        self.jobs[job.channel_id, job.post_id] = job
+        self.wakeup.set()
+
+    def drop(self, reason):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+        metrics.send_dropped_total.inc(reason=reason)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    @property
+    def paused(self):
+        return self.paused_until > time.time()
+
+    async def run(self):
+        while True:
+            if not self.jobs:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            # Earliest turn first; a few dozen jobs at most, so a scan is cheaper than a heap
+            job = min(self.jobs.values(), key=lambda j: j.due)
+            delay = max(job.due, self.paused_until) - time.time()
+            if delay > 0:
+                # Sleep until the turn, but wake for a new post that may be due sooner
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            del self.jobs[job.channel_id, job.post_id]
+            if time.time() - job.received_at > self.max_age:
+                self.drop("stale")
+                continue
+            self.sending = True
+            try:
+                await self.send(job)
+            except Exception as e:
+                log.exception(f"⚠️ [{self.account.name}] Yuborishda xatolik: {e}", extra=logs.fields(account=self.account.name))
+            finally:
+                self.sending = False
+
+    async def send(self, job):
+        # Skip channels this account is restricted in; expired entries are already gone
+        if cache.restrictions.is_blocked(self.account.id, job.channel_id):
+            return
+        comment_id, comment, _ = comment_picker.draw(job.channel_id, job.comments)
+        await send_comment(self.account, job.channel_id, job.post_id, comment, job.trace, comment_id)
+
+class Dispatcher:
+    """Queues each post once for every account whose client delivered it.
+
+    Every client registers the same handler, filtered at registration to the
+    configured channels. Only members of a channel receive its posts, so an
+    account is queued when its own client delivers the post; turns are counted
+    from the first arrival, and later album messages are dropped.
+    """
+
+    def __init__(self):
+        self.accounts = {} # {account_index: Account}
+        self.clients = {} # {client: Account}, to find the account an update came from
+        self.total_accounts = 0
+        self.chats = frozenset()
+        self.recent = RecentPosts()
+        self.workers = {} # {account_index: SendQueue.run task}
+        self.closing = False # Set on shutdown: new posts are ignored while queues drain
+
+    @property
+    def pending(self):
+        """Posts queued or being sent, over all accounts"""
+        return sum(len(account.queue) for account in self.accounts.values())
+
+    def add(self, account):
+        self.accounts[account.index] = account
+        self.clients[account.client] = account
+        self.workers[account.index] = asyncio.create_task(account.queue.run())
+        self.listen(account.client)
+
+    def remove(self, account):
+        if self.accounts.get(account.index) is account:
+            del self.accounts[account.index]
+            self.workers.pop(account.index).cancel()
+        if self.clients.get(account.client) is account:
+            del self.clients[account.client]
+        account.client.remove_event_handler(self.on_post)
+
+    def listen(self, client):
+        client.remove_event_handler(self.on_post)
+        client.add_event_handler(self.on_post, events.NewMessage(chats=list(self.chats)))
+
+    def update_chats(self, snapshot):
+        """Cache listener: re-registers handlers when the set of configured channels changes"""
+        chats = frozenset(snapshot.channels_config)
+        if chats != self.chats:
+            self.chats = chats
+            for account in self.accounts.values():
+                self.listen(account.client)
+
+    async def drain(self, poll=0.1):
+        """Stops taking posts and waits for every queued comment to be sent or dropped"""
+        self.closing = True
+        while self.pending:
+            await asyncio.sleep(poll)
+
+    async def on_post(self, event):
+        account = self.clients.get(event.client)
+        if self.closing or account is None:
+            return
+        comments = cache.snapshot.channels_config.get(event.chat_id)
+        if not comments:
+            return
+        post = self.recent.claim(event.chat_id, event.id, event.grouped_id, account.index)
+        if post is None:
+            return
 
-async def send_comment(session, client, name, channel_id, post_id, comment):
-    # Resolve channel name first so it's available in success or error logs
+        received_at = post.received_at
+        posted_at = event.date.timestamp() if event.date else received_at
+        trace = Trace(event.chat_id, account.name, posted_at, received_at)
+        due = received_at + self.turn_delay(account, event.chat_id, post.post_id)
+        account.queue.put(SendJob(event.chat_id, post.post_id, comments, trace, received_at, due))
+
+    def turn_delay(self, account, channel_id, post_id):
+        # ADVANCED ANTI-DETECTION: Seeded randomization per message
+        # All running clients will generate the SAME random order for the SAME message ID
+        # Determine this account's position in the current post's queue
+        my_pos = turn_order.position(channel_id, post_id, account.index, self.total_accounts)
+
+        if my_pos == 0:
+            return 0 # This post's sniper
+        # Staggered delay based on position
+        base_delay = my_pos * TURN_DELAY
+        human_jitter = random.uniform(*TURN_JITTER)
+        return base_delay + human_jitter
+
+dispatcher = Dispatcher()
+cache.on_change(dispatcher.update_chats)
+entity_resolver = EntityResolver(lambda: dispatcher.accounts.values())
+cache.on_change(entity_resolver.on_snapshot)
+comment_picker = CommentPicker()
+cache.on_change(comment_picker.on_snapshot)
+
+metrics.handler_queue_depth.callback = lambda: dispatcher.pending
+metrics.send_queue_depth.callback = lambda: {(a.name,): len(a.queue) for a in dispatcher.accounts.values()}
+metrics.accounts_paused.callback = lambda: sum(a.queue.paused for a in dispatcher.accounts.values())
+metrics.cache_version.callback = lambda: cache.version
+metrics.registry.gauge("autoreply_admin_log_lines", "Admin log pipeline counters", ("state",),
+                       callback=lambda: {(k,): v for k, v in admin_log.stats().items()})
+metrics.registry.gauge("autoreply_comment_log_rows", "Send history rows by state", ("state",),
+                       callback=lambda: {(k,): v for k, v in history.stats().items()})
+
+class Startup:
+    """Limits concurrent account logins and reports per-account and fleet readiness timings"""
+
+    def __init__(self, concurrency=STARTUP_CONCURRENCY, stagger=STARTUP_STAGGER):
+        self.concurrency = concurrency
+        self.stagger = stagger
+        self.semaphore = None
+        self.launches = 0 # Slots handed out since begin()
+        self.total = 0
+        self.started_at = None
+        self.timings = {} # {account_index: (name, seconds to ready, {phase: seconds})}
+        self.failed = set()
+        self.fleet_ready = asyncio.Event()
+
+    def begin(self, total):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.launches = 0
+        self.total = total
+        self.started_at = time.monotonic()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Waits for a free login slot; the first wave of logins is spread `stagger` apart"""
+        async with self.semaphore:
+            wave = self.launches
+            self.launches += 1
+            if wave < self.concurrency:
+                # Later logins, restarts included, start as slots free up one at a time
+                await asyncio.sleep(wave * self.stagger)
+            yield
+
+    def ready(self, account_index, name, phases):
+        elapsed = time.monotonic() - self.started_at
+        self.timings[account_index] = (name, elapsed, phases)
+        metrics.account_ready_seconds.set(round(elapsed, 3), account=name)
+        details = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in phases.items())
+        log.info(f"[{name}] tayyor: {elapsed:.2f}s ({details})", extra=logs.fields(account=name, ready_seconds=round(elapsed, 3)))
+        send_to_admin(f"🚀 **{name}** ishga tushdi (Idx: {account_index}): {elapsed:.1f}s ({details})")
+        self.check_fleet()
+
+    def fail(self, account_index):
+        if account_index not in self.timings:
+            self.failed.add(account_index)
+            self.check_fleet()
+
+    def check_fleet(self):
+        if self.fleet_ready.is_set() or len(self.timings) + len(self.failed) < self.total:
+            return
+        self.fleet_ready.set()
+        elapsed = time.monotonic() - self.started_at
+        metrics.fleet_ready_seconds.set(elapsed)
+        metrics.accounts_failed.set(len(self.failed))
+        text = f"🏁 Barcha akkauntlar tayyor: {len(self.timings)}/{self.total} ({len(self.failed)} xato), {elapsed:.1f}s."
+        if self.timings:
+            name, slowest, _ = max(self.timings.values(), key=lambda t: t[1])
+            text += f"\n🐢 Eng sekin: {name} ({slowest:.1f}s)"
+        log.info(text)
+        send_to_admin(text)
+
+startup = Startup()
+
+def send_to_admin(text: str):
+    """Queues a log line for the admin chat; never blocks"""
+    admin_log.send(text)
+
+async def send_comment(account, channel_id, post_id, comment, trace=None, comment_id=None):
+    client, name = account.client, account.name
+    if trace:
+        trace.mark("wait")
+    outcome = "ok"
+    # Channel name for the logs; never resolved on the hot path
     channel_name = cache.entities.get(channel_id)
     if not channel_name:
-        try:
-            entity = await client.get_entity(channel_id)
-            channel_name = entity.title
-            cache.entities[channel_id] = channel_name
-        except Exception:
-            channel_name = f"ID: {channel_id}"
+        entity_resolver.request(channel_id)
+        channel_name = f"ID: {channel_id}"
 
     try:
         # Zero-latency: directly send using cached info
-        await client.send_message(entity=channel_id, message=comment, comment_to=post_id)
-        
-        text = f"✅ **{name}** → {channel_name}\n💬 {comment}"
-        print(text)
-        asyncio.create_task(send_to_admin(session, text))
+        peer = input_peer(account, channel_id)
+        if trace:
+            trace.mark("resolve")
+        await client.send_message(entity=peer, message=comment, comment_to=post_id)
+        if trace:
+            trace.mark("send")
+            metrics.post_to_comment_seconds.observe(trace.finish())
+        if isinstance(peer, int):
+            # Keep the hash telethon just used so the next restart doesn't need it resolved
+            try:
+                entity_resolver.remember(account, channel_id, await client.get_input_entity(channel_id))
+            except Exception:
+                pass
+        metrics.comment_sends_total.inc(outcome="ok")
+        send_to_admin(f"✅ **{name}** → {channel_name}\n💬 {comment}")
         
     except FloodWaitError as e:
-        await send_to_admin(session, f"⏳ **{name}**: FloodWait ({e.seconds}s) @ {channel_name}. To'xtatildi.")
-        await asyncio.sleep(e.seconds + 2)
+        outcome = "FloodWaitError"
+        metrics.comment_sends_total.inc(outcome=outcome)
+        metrics.floodwait_seconds_total.inc(e.seconds)
+        send_to_admin(f"⏳ **{name}**: FloodWait ({e.seconds}s) @ {channel_name}. To'xtatildi.")
+        account.queue.pause(e.seconds + FLOODWAIT_MARGIN) # The worker holds every queued post until it ends
     except ChatWriteForbiddenError:
+        outcome = "ChatWriteForbiddenError"
+        metrics.comment_sends_total.inc(outcome=outcome)
         try:
             # Check the restriction reason and duration
             participant = await client(GetParticipantRequest(channel_id, 'me'))
@@ -81,122 +488,175 @@ async def send_comment(session, client, name, channel_id, post_id, comment):
                 until = rights.until_date
                 
                 if until is None or (until.year > 2030): # Permanent or effectively permanent
-                    await send_to_admin(session, f"🚫 **{name}**: {channel_name} dan umrbod haydalgan (Banned). Kanal tark etilmoqda...")
+                    send_to_admin(f"🚫 **{name}**: {channel_name} dan umrbod haydalgan (Banned). Kanal tark etilmoqda...")
                     await client(LeaveChannelRequest(channel_id))
                 else:
                     # Temporary restriction
                     formatted_date = until.strftime("%Y-%m-%d %H:%M")
-                    await db.add_restriction(client.session.save(), channel_id, until)
-                    await update_cache()
-                    await send_to_admin(session, f"⏳ **{name}**: {channel_name} da yozish cheklangan. Muddati: `{formatted_date}` gacha.")
+                    cache.restrictions.block(account.id, channel_id, until)
+                    await db.add_restriction(account.id, channel_id, until)
+                    send_to_admin(f"⏳ **{name}**: {channel_name} da yozish cheklangan. Muddati: `{formatted_date}` gacha.")
             else:
-                await send_to_admin(session, f"🚫 **{name}**: {channel_name} da yozish taqiqlangan (Mute/Banned).")
+                send_to_admin(f"🚫 **{name}**: {channel_name} da yozish taqiqlangan (Mute/Banned).")
         except Exception as e:
-            await send_to_admin(session, f"🚫 **{name}**: {channel_name} da yozish taqiqlangan (Xatolik: {e})")
+            send_to_admin(f"🚫 **{name}**: {channel_name} da yozish taqiqlangan (Xatolik: {e})")
     except ChannelPrivateError:
-        await send_to_admin(session, f"🔒 **{name}**: {channel_name} kanal yopiq yoki akkaunt chiqarilgan.")
+        outcome = "ChannelPrivateError"
+        metrics.comment_sends_total.inc(outcome=outcome)
+        send_to_admin(f"🔒 **{name}**: {channel_name} kanal yopiq yoki akkaunt chiqarilgan.")
     except Exception as e:
-        await send_to_admin(session, f"⚠️ **{name}**: {channel_name} xatolik - {str(e)[:100]}")
+        outcome = type(e).__name__
+        metrics.comment_sends_total.inc(outcome=outcome)
+        send_to_admin(f"⚠️ **{name}**: {channel_name} xatolik - {str(e)[:100]}")
+    finally:
+        # Same fields as the admin message; success lines are sampled by LOG_SAMPLE_RATE
+        send_log.log(logging.INFO if outcome == "ok" else logging.WARNING, f"{name} → {channel_name}: {outcome}",
+                     extra=logs.fields(account=name, account_id=account.id, channel=channel_name, channel_id=channel_id,
+                                       post_id=post_id, comment_id=comment_id, outcome=outcome))
+        # Buffered; the history writer COPYs it to comment_log in batches
+        history.record(account.id, channel_id, post_id, comment_id, outcome,
+                       trace.posted_at if trace else None, trace.received_at if trace else None, time.time())
 
-async def run_client(session, session_str, account_index, total_accounts):
-    client = TelegramClient(StringSession(session_str), API_ID, API_HASH)
+def make_client(session_str):
+    """Builds the Telegram client for an account; the benchmark harness swaps in a fake"""
+    return TelegramClient(StringSession(session_str), API_ID, API_HASH)
+
+async def run_client(account_id, session_str, account_index):
+    client = make_client(session_str)
     
     try:
-        await client.connect()
-        
-        if not await client.is_user_authorized():
-            await send_to_admin(session, f"❌ Akkaunt seansi faol emas (Session revoked).")
-            return
+        async with startup.slot():
+            phases = {}
+            t = time.monotonic()
+            await client.connect()
+            phases["connect"] = time.monotonic() - t
 
-        me = await client.get_me()
-        name = f"{me.first_name} {me.last_name or ''}".strip() or "Noma'lum"
+            t = time.monotonic()
+            if not await client.is_user_authorized():
+                send_to_admin(f"❌ Akkaunt seansi faol emas (Session revoked).")
+                return
+            phases["authorize"] = time.monotonic() - t
 
-        # Pre-fetch entities for current config
-        for ch_id in cache.channels_config.keys():
-            try:
-                entity = await client.get_entity(ch_id)
-                cache.entities[ch_id] = entity.title
-            except Exception:
-                pass
+            t = time.monotonic()
+            me = await client.get_me()
+            name = f"{me.first_name} {me.last_name or ''}".strip() or "Noma'lum"
+            phases["get_me"] = time.monotonic() - t
 
-        await send_to_admin(session, f"🚀 **{name}** ishga tushdi (Idx: {account_index})!")
-        print(f"[{name}] Monitoring started...")
-
-        @client.on(events.NewMessage())
-        async def handler(event):
-            channel_id = event.chat_id
-            comments = cache.channels_config.get(channel_id)
-            
-            if comments:
-                # Check for active restriction in cache
-                restriction_until = cache.restrictions.get((session_str, channel_id))
-                if restriction_until:
-                    # If restriction hasn't expired, skip
-                    if restriction_until > datetime.now(restriction_until.tzinfo):
-                        return
-                    else:
-                        # Expired: remove from cache (DB clean will happen on next update)
-                        cache.restrictions.pop((session_str, channel_id), None)
-
-                # ADVANCED ANTI-DETECTION: Seeded randomization per message
-                # All running clients will generate the SAME random order for the SAME message ID
-                rng = random.Random(event.id)
-                order = list(range(total_accounts))
-                rng.shuffle(order)
-                
-                # Determine this account's position in the current post's queue
-                my_pos = order.index(account_index)
-                
-                if my_pos == 0:
-                    total_delay = 0 # This post's sniper
-                else:
-                    # Staggered delay based on position
-                    base_delay = my_pos * 0.5 
-                    human_jitter = random.uniform(0.1, 0.4) 
-                    total_delay = base_delay + human_jitter
-                
-                if total_delay > 0:
-                    await asyncio.sleep(total_delay)
-                
-                comment = random.choice(comments)
-                asyncio.create_task(send_comment(session, client, name, channel_id, event.id, comment))
+        log.info(f"[{name}] Monitoring started...", extra=logs.fields(account=name, account_id=account_id))
 
-        await client.run_until_disconnected()
+        account = Account(account_id, account_index, client, name, session_str)
+        dispatcher.add(account)
+        startup.ready(account_index, name, phases)
+        try:
+            await client.run_until_disconnected()
+        finally:
+            dispatcher.remove(account)
 
     except UserDeactivatedError:
-        await send_to_admin(session, f"❌ **Akkaunt o'chirilgan (Banned by Telegram).**")
+        send_to_admin(f"❌ **Akkaunt o'chirilgan (Banned by Telegram).**")
     except AuthKeyDuplicatedError:
-        await send_to_admin(session, f"❌ **Sessiya dublikati (Boshqa joyda ochilgan).**")
+        send_to_admin(f"❌ **Sessiya dublikati (Boshqa joyda ochilgan).**")
     except Exception as e:
-        await send_to_admin(session, f"🔴 **Kritik xatolik ({session_str[:10]}...):** {e}")
+        send_to_admin(f"🔴 **Kritik xatolik ({session_str[:10]}...):** {e}")
+        raise # The supervisor restarts the account with backoff
     finally:
+        startup.fail(account_index) # No-op once the account reported ready
         await client.disconnect()
 
 async def cache_updater_loop():
-    """Background task to keep cache fresh every minute"""
+    """Cheap watermark refresh every minute, with a slow full resync as a safety net"""
+    last_resync = time.monotonic()
     while True:
-        await update_cache()
-        await asyncio.sleep(60)
+        await asyncio.sleep(CACHE_REFRESH_INTERVAL)
+        if time.monotonic() - last_resync >= CACHE_RESYNC_INTERVAL:
+            last_resync = time.monotonic()
+            await safe_update_cache()
+            continue
+        try:
+            await refresh_cache()
+        except Exception as e:
+            log.warning(f"⚠️ Cache o'zgarishlari qo'llanilmadi: {e}")
 
-async def main():
-    await db.connect()
+async def restriction_cleanup_loop():
+    """Deletes expired restriction rows; the in-memory index expires its own entries"""
+    while True:
+        await asyncio.sleep(RESTRICTION_CLEANUP_INTERVAL)
+        try:
+            deleted = await db.delete_expired_restrictions()
+            if deleted:
+                log.info(f"🧹 {deleted} ta muddati o'tgan cheklov o'chirildi.")
+        except Exception as e:
+            log.warning(f"⚠️ Cheklovlar tozalanmadi: {e}")
+
+async def cache_listener_loop():
+    """Keeps a LISTEN connection open and catches up with a full reload after it drops"""
+    while True:
+        try:
+            await db.listen_changes(on_db_change)
+        except Exception as e:
+            log.warning(f"⚠️ DB tinglovchisi uzildi: {e}")
+        await asyncio.sleep(5)
+        await safe_update_cache()
+
+async def sync_with_db():
+    """Loads titles and the cache from the DB, then starts the tasks that keep them current"""
+    await load_entities()
     await update_cache()
-    
-    accounts = await db.get_active_accounts()
+
+    # Background cache updaters: change notifications plus a slow full resync
+    supervisor.spawn("cache_listener", cache_listener_loop, restart=True)
+    supervisor.spawn("cache_apply", apply_changes_loop, restart=True)
+    supervisor.spawn("cache_updater", cache_updater_loop, restart=True)
+    supervisor.spawn("restriction_cleanup", restriction_cleanup_loop, restart=True)
+    supervisor.spawn("history_pruner", history.prune_loop, restart=True)
+    # Channel titles are resolved once for all accounts, off the hot path
+    supervisor.spawn("entity_resolver", entity_resolver.run, restart=True)
+
+async def load_accounts():
+    await db.connect()
+    return await db.get_active_accounts()
+
+async def main():
+    supervisor.on_close(db.close)
+    supervisor.on_close(cache_file.flush)
+    supervisor.spawn("cache_file", cache_file.run, restart=True)
+
+    # Accounts always come from the DB; with the last run's cache on disk the full
+    # reload happens in the background instead of before the accounts start.
+    # A DB that is down at startup is waited out rather than ending the process.
+    warm = cache_file.load()
+    accounts = await supervisor.retry("db_connect", load_accounts)
+    if warm:
+        supervisor.spawn("db_sync", sync_with_db, restart=True)
+    else:
+        await supervisor.retry("db_sync", sync_with_db)
     if not accounts:
-        print("⚠️ Hech qanday faol akkaunt topilmadi.")
+        log.warning("⚠️ Hech qanday faol akkaunt topilmadi.")
         return
 
     async with aiohttp.ClientSession() as session:
-        # Background cache updater
-        asyncio.create_task(cache_updater_loop())
+        # Single consumer that batches admin log lines
+        supervisor.spawn("admin_log", lambda: admin_log.run(session), restart=True)
+        supervisor.spawn("restriction_expiry", cache.restrictions.run, restart=True)
+        # Buffers while the DB is unreachable
+        supervisor.spawn("history_writer", history.run, restart=True)
+
+        # On shutdown: finish queued comments first, then write their history and deliver their log lines
+        supervisor.on_drain(dispatcher.drain)
+        supervisor.on_drain(history.drain)
+        supervisor.on_drain(admin_log.drain)
         
-        # Start accounts with their index and total count
-        tasks = [
-            asyncio.create_task(run_client(session, acc['session_string'], idx, len(accounts))) 
-            for idx, acc in enumerate(accounts)
-        ]
-        await asyncio.gather(*tasks)
+        # Start accounts with their index; turns are computed against the total count.
+        # Logins overlap up to STARTUP_CONCURRENCY at a time.
+        dispatcher.total_accounts = len(accounts)
+        startup.begin(len(accounts))
+        for idx, acc in enumerate(accounts):
+            runner = functools.partial(run_client, acc['id'], acc['session_string'], idx)
+            supervisor.spawn(f"account:{acc['id']}", runner, restart=True)
+
+        # The session stays open until the admin log has been drained
+        await supervisor.drained.wait()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    logs.setup()
+    asyncio.run(supervisor.run(("userbot", main)))
@@ -0,0 +1,182 @@
+import os
+import bisect
+import logging
+from aiohttp import web
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(keys, values):
+    if not keys:
+        return ""
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(keys, values))
+    return "{" + pairs + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {} # {label values tuple: value}
+
+    def key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, _labels(self.label_names, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {value}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """A settable value, or one read from `callback` at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback # Returns a number, or {label values tuple: number}
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            values = value if isinstance(value, dict) else {(): value}
+            for key, v in values.items():
+                yield self.name, _labels(self.label_names, key), v
+        else:
+            yield from super().samples()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * len(self.buckets), 0, 0.0] # bucket counts, count, sum
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += 1
+        state[2] += value
+
+    def samples(self):
+        names = self.label_names + ("le",)
+        for key, (counts, count, total) in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket", _labels(names, key + (bound,)), cumulative
+            yield f"{self.name}_bucket", _labels(names, key + ("+Inf",)), count
+            yield f"{self.name}_count", _labels(self.label_names, key), count
+            yield f"{self.name}_sum", _labels(self.label_names, key), total
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self.register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+registry = Registry()
+
+# --- Userbot ---
+post_to_comment_seconds = registry.histogram(
+    "autoreply_post_to_comment_seconds", "Time from a post's publish date to our comment being sent")
+handler_queue_depth = registry.gauge(
+    "autoreply_handler_queue_depth", "Posts queued or being sent, over all accounts")
+send_queue_depth = registry.gauge(
+    "autoreply_send_queue_depth", "Posts queued or being sent per account", ("account",))
+send_dropped_total = registry.counter(
+    "autoreply_send_dropped_total", "Queued posts dropped without a comment by reason", ("reason",))
+accounts_paused = registry.gauge(
+    "autoreply_accounts_paused", "Accounts waiting out a FloodWait")
+posts_deduplicated_total = registry.counter(
+    "autoreply_posts_deduplicated_total", "Messages skipped as part of a post already dispatched", ("kind",))
+comment_sends_total = registry.counter(
+    "autoreply_comment_sends_total", "Comment send attempts by outcome", ("outcome",))
+floodwait_seconds_total = registry.counter(
+    "autoreply_floodwait_seconds_total", "FloodWait seconds honored")
+cache_refresh_seconds = registry.histogram(
+    "autoreply_cache_refresh_seconds", "Cache refresh duration", ("kind",))
+cache_version = registry.gauge(
+    "autoreply_cache_version", "Version of the current cache snapshot")
+account_ready_seconds = registry.gauge(
+    "autoreply_account_ready_seconds", "Seconds from process start until the account was listening", ("account",))
+fleet_ready_seconds = registry.gauge(
+    "autoreply_fleet_ready_seconds", "Seconds from process start until every account was ready or failed")
+accounts_failed = registry.gauge(
+    "autoreply_accounts_failed", "Accounts that failed to start")
+
+# --- Process ---
+task_restarts_total = registry.counter(
+    "autoreply_task_restarts_total", "Supervised tasks restarted after a crash", ("task",))
+
+# --- Database ---
+db_pool_acquire_seconds = registry.histogram(
+    "autoreply_db_pool_acquire_seconds", "Time spent waiting for a pool connection", ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+# --- Admin bot ---
+admin_update_seconds = registry.histogram(
+    "autoreply_admin_update_seconds", "Admin bot update handling time")
+registration_sessions = registry.gauge(
+    "autoreply_registration_sessions", "Pending account logins holding a connected client")
+admin_view_cache_total = registry.counter(
+    "autoreply_admin_view_cache_total", "Admin screen lookups by result", ("result",))
+
+async def handle_metrics(request):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serves /metrics on the running event loop; returns the runner for cleanup"""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.getLogger("metrics").info(f"📈 Metrikalar: http://{host}:{port}/metrics")
+    return runner
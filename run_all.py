@@ -1,16 +1,25 @@
 import asyncio
+import logging
+import metrics
+import logs
 from admin_bot import admin_bot_main
 from main import main as userbot_main
+from supervisor import supervisor
+
+log = logging.getLogger("run_all")
 
 async def start_everything():
-    print("🚀 Loyihani to'liq ishga tushirish (Admin Bot + Userbot)...")
-    await asyncio.gather(
-        admin_bot_main(),
-        userbot_main()
+    log.info("🚀 Loyihani to'liq ishga tushirish (Admin Bot + Userbot)...")
+    metrics_runner = await metrics.start_server()
+    supervisor.on_close(metrics_runner.cleanup)
+    await supervisor.run(
+        ("admin_bot", admin_bot_main),
+        ("userbot", userbot_main),
     )
 
 if __name__ == "__main__":
+    logs.setup()
     try:
         asyncio.run(start_everything())
     except KeyboardInterrupt:
-        print("🛑 To'xtatildi.")
+        log.info("🛑 To'xtatildi.")
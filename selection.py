@@ -0,0 +1,107 @@
+import os
+import random
+from collections import deque
+
+COMMENT_REPEAT_WINDOW = int(os.getenv("COMMENT_REPEAT_WINDOW", "10")) # Draws before a text may repeat
+MAX_REJECTIONS = 8 # Resamples before falling back to a scan of the non-recent comments
+
+class Deck:
+    """Weighted comment draws for one channel: O(1) alias-table sampling plus a window of
+    recently drawn comments that are rejected, so a text doesn't repeat within `window` draws.
+
+    A comment can come up at most once per window + 1 draws, so the window is kept
+    below total weight / heaviest weight (none at all once a comment holds more than half
+    the weight) and heavy comments aren't capped below their weight share; with equal
+    weights it has no effect on the shares. Skipping recent picks still pulls unequal
+    shares somewhat toward each other. The window is also clamped to half the comments
+    so there is always some choice left.
+    """
+    __slots__ = ("comments", "texts", "prob", "alias", "window", "recent", "recent_set")
+
+    def __init__(self, comments, window=COMMENT_REPEAT_WINDOW, recent_texts=()):
+        self.comments = comments # [(id, text, weight)] as held by the cache snapshot
+        self.texts = [text for _, text, _ in comments]
+        weights = [weight for _, _, weight in comments]
+        self.prob, self.alias = self.build(weights)
+        self.window = max(0, min(window, len(comments) // 2, sum(weights) // max(weights) - 1))
+        self.recent = deque()
+        self.recent_set = set()
+        # Keep the repeat window across a rebuild for texts that are still there
+        if self.window:
+            index = {text: i for i, text in enumerate(self.texts)}
+            for text in list(recent_texts)[-self.window:]:
+                if text in index and index[text] not in self.recent_set:
+                    self.remember(index[text])
+
+    @staticmethod
+    def build(weights):
+        """Vose's alias method: (prob, alias) tables for weighted sampling"""
+        n = len(weights)
+        total = sum(weights)
+        prob = [w * n / total for w in weights]
+        alias = [0] * n
+        small = [i for i, p in enumerate(prob) if p < 1]
+        large = [i for i, p in enumerate(prob) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            alias[s] = l
+            prob[l] -= 1 - prob[s]
+            (small if prob[l] < 1 else large).append(l)
+        for i in small + large: # Leftovers are 1 up to float error
+            prob[i] = 1.0
+        return prob, alias
+
+    def sample(self):
+        i = int(random.random() * len(self.prob))
+        return i if random.random() < self.prob[i] else self.alias[i]
+
+    def remember(self, i):
+        if len(self.recent) >= self.window:
+            self.recent_set.discard(self.recent.popleft())
+        self.recent.append(i)
+        self.recent_set.add(i)
+
+    def draw(self):
+        i = self.sample()
+        if self.window:
+            attempts = 0
+            while i in self.recent_set:
+                attempts += 1
+                if attempts > MAX_REJECTIONS:
+                    # Recent comments hold most of the weight; pick among the rest directly
+                    rest = [j for j in range(len(self.texts)) if j not in self.recent_set]
+                    i = random.choices(rest, weights=[self.comments[j][2] for j in rest])[0]
+                    break
+                i = self.sample()
+            self.remember(i)
+        return self.comments[i]
+
+    def recent_texts(self):
+        return [self.texts[i] for i in self.recent]
+
+class CommentPicker:
+    """One Deck per channel, shared by every account in the process.
+
+    Decks are rebuilt only for channels whose comments changed between snapshots.
+    """
+    def __init__(self, window=COMMENT_REPEAT_WINDOW):
+        self.window = window
+        self.decks = {} # {channel_id: Deck}
+
+    def on_snapshot(self, snapshot):
+        """Cache listener: rebuilds the decks of changed channels and drops removed ones"""
+        decks = {}
+        for channel_id, comments in snapshot.channels_config.items():
+            deck = self.decks.get(channel_id)
+            if deck is not None and (deck.comments is comments or deck.comments == comments):
+                decks[channel_id] = deck
+            elif comments:
+                decks[channel_id] = Deck(comments, self.window, deck.recent_texts() if deck else ())
+        self.decks = decks
+
+    def draw(self, channel_id, comments):
+        """Next (id, text, weight) for `channel_id`; `comments` covers a channel the picker hasn't seen"""
+        deck = self.decks.get(channel_id)
+        if deck is None:
+            deck = self.decks[channel_id] = Deck(comments, self.window)
+        return deck.draw()
@@ -0,0 +1,143 @@
+import os
+import time
+import signal
+import asyncio
+import logging
+import metrics
+from logs import fields
+
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20")) # Seconds to drain queues after SIGTERM
+RESTART_BACKOFF = (1.0, 60.0) # First and longest delay before restarting a crashed task, seconds
+RESTART_RESET_AFTER = 300 # A task that ran this long before crashing starts over at the first delay
+
+log = logging.getLogger("supervisor")
+
+class Supervisor:
+    """Owns the process's long-running tasks and its shutdown.
+
+    Tasks started with spawn() are tracked by name; with restart=True a task that
+    raises is started again with exponential backoff. On SIGTERM/SIGINT the
+    registered drainers run in order within SHUTDOWN_TIMEOUT (stop taking work,
+    finish queued sends, flush logs), then every task is cancelled and awaited and
+    the closers run (DB pools, servers).
+    """
+
+    def __init__(self, drain_timeout=SHUTDOWN_TIMEOUT):
+        self.drain_timeout = drain_timeout
+        self.tasks = {} # {name: Task}
+        self.drainers = [] # async callables, run in registration order
+        self.closers = [] # async callables, run in reverse registration order
+        self.stopping = asyncio.Event()
+        self.drained = asyncio.Event() # Set once drainers are done; owners of shared resources wait on it
+        self.exit_code = 0 # Non-zero once a critical task failed, so the platform restarts the process
+
+    def spawn(self, name, factory, restart=False, critical=False):
+        """Runs `await factory()` as a tracked task named `name`; a critical task that
+        raises stops the whole process"""
+        task = asyncio.create_task(self.supervise(name, factory, restart, critical), name=name)
+        self.tasks[name] = task
+        task.add_done_callback(lambda t: self.tasks.pop(name, None) if self.tasks.get(name) is t else None)
+        return task
+
+    def on_drain(self, drainer):
+        self.drainers.append(drainer)
+
+    def on_close(self, closer):
+        self.closers.append(closer)
+
+    async def supervise(self, name, factory, restart, critical=False):
+        delay = RESTART_BACKOFF[0]
+        while True:
+            started = time.monotonic()
+            try:
+                return await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not restart or self.stopping.is_set():
+                    log.error(f"🔴 [{name}] to'xtadi: {e!r}", extra=fields(task=name))
+                    if critical:
+                        self.exit_code = 1
+                        self.stop()
+                    return
+                if time.monotonic() - started > RESTART_RESET_AFTER:
+                    delay = RESTART_BACKOFF[0]
+                metrics.task_restarts_total.inc(task=name)
+                log.warning(f"⚠️ [{name}] yiqildi: {e!r}. {delay:.0f}s dan keyin qayta ishga tushiriladi.", extra=fields(task=name))
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay)
+                return # Shutting down, don't restart
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, RESTART_BACKOFF[1])
+
+    async def retry(self, name, factory):
+        """Awaits factory() until it succeeds, with the restart backoff; for startup steps
+        such as the first DB connection, which must wait out an outage instead of failing
+        the process"""
+        delay = RESTART_BACKOFF[0]
+        while True:
+            try:
+                return await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"⚠️ [{name}] bajarilmadi: {e!r}. {delay:.0f}s dan keyin qayta uriniladi.", extra=fields(task=name))
+            await asyncio.sleep(delay) # Shutdown cancels the waiting main
+            delay = min(delay * 2, RESTART_BACKOFF[1])
+
+    def stop(self):
+        if not self.stopping.is_set():
+            log.info("🛑 To'xtatish signali olindi, navbatlar yakunlanmoqda...")
+            self.stopping.set()
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError: # Windows
+                pass
+
+    async def run(self, *mains):
+        """Runs (name, coroutine function) mains until they all return or a stop signal
+        arrives, then shuts down. Exits non-zero if a main raised."""
+        self.install_signal_handlers()
+        main_tasks = [self.spawn(name, main, critical=True) for name, main in mains]
+        everything_done = asyncio.ensure_future(asyncio.gather(*main_tasks, return_exceptions=True))
+        stop_requested = asyncio.ensure_future(self.stopping.wait())
+        await asyncio.wait((everything_done, stop_requested), return_when=asyncio.FIRST_COMPLETED)
+        stop_requested.cancel()
+        self.stopping.set()
+        await self.shutdown()
+        if self.exit_code:
+            raise SystemExit(self.exit_code)
+
+    async def shutdown(self):
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.drain(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"⚠️ Navbatlar {self.drain_timeout:.0f}s ichida yakunlanmadi, qolgan ishlar bekor qilinadi.")
+        self.drained.set()
+
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for closer in reversed(self.closers):
+            try:
+                await closer()
+            except Exception as e:
+                log.warning(f"⚠️ Yopishda xatolik: {e!r}")
+        log.info(f"🛑 To'xtatildi ({time.monotonic() - start:.1f}s).")
+
+    async def drain(self):
+        for drainer in self.drainers:
+            try:
+                await drainer()
+            except Exception as e:
+                log.warning(f"⚠️ Navbatni yakunlashda xatolik: {e!r}")
+
+supervisor = Supervisor()
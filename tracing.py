@@ -0,0 +1,77 @@
+import time
+from collections import deque
+
+STAGES = ("arrival", "wait", "resolve", "send", "total")
+WINDOW = 1000 # Recent samples kept per (channel, stage)
+
+class Trace:
+    """Span-style stage timings for one post on one account.
+
+    arrival: post published -> handler received it
+    wait:    handler -> send started (turn delay and scheduling)
+    resolve: peer/title lookup
+    send:    send_message RPC
+    """
+    __slots__ = ("channel_id", "account", "posted_at", "received_at", "last", "stages")
+
+    def __init__(self, channel_id, account, posted_at, received_at):
+        self.channel_id = channel_id
+        self.account = account
+        self.posted_at = posted_at
+        self.received_at = received_at
+        self.last = received_at
+        self.stages = {"arrival": max(received_at - posted_at, 0.0)}
+
+    def mark(self, stage):
+        now = time.time()
+        self.stages[stage] = now - self.last
+        self.last = now
+
+    def finish(self):
+        self.stages["total"] = max(self.last - self.posted_at, 0.0)
+        recorder.record(self)
+        return self.stages["total"]
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+class Recorder:
+    """Keeps the last WINDOW durations per (channel, stage), and per account for the
+    total, for percentile summaries"""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.samples = {} # {(channel_id, stage): deque of seconds}
+        self.accounts = {} # {account: deque of total seconds}
+
+    def record(self, trace):
+        for stage, seconds in trace.stages.items():
+            key = (trace.channel_id, stage)
+            samples = self.samples.get(key)
+            if samples is None:
+                samples = self.samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+        totals = self.accounts.get(trace.account)
+        if totals is None:
+            totals = self.accounts[trace.account] = deque(maxlen=self.window)
+        totals.append(trace.stages["total"])
+
+    def summary(self):
+        """{channel_id: {stage: (count, p50, p95, p99)}} in seconds"""
+        result = {}
+        for (channel_id, stage), samples in self.samples.items():
+            values = sorted(samples)
+            result.setdefault(channel_id, {})[stage] = (
+                len(values), percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99)
+            )
+        return result
+
+    def account_summary(self):
+        """{account: (count, p50, p95, p99)} of the total, in seconds"""
+        result = {}
+        for account, samples in self.accounts.items():
+            values = sorted(samples)
+            result[account] = (len(values), percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99))
+        return result
+
+recorder = Recorder()